@@ -26,6 +26,11 @@ from .const import (
     CONF_AWS_ACCESS_KEY_ID,
     CONF_AWS_SECRET_ACCESS_KEY,
     CONF_AWS_REGION_NAME,
+    CONF_IMAGE_FORMAT,
+    CONF_IMAGE_QUALITY,
+    CONF_CHROMA_SUBSAMPLING,
+    CONF_OPTIMIZE_IMAGES,
+    CONF_MAX_IMAGE_BYTES,
     MESSAGE,
     REMEMBER,
     USE_MEMORY,
@@ -39,6 +44,10 @@ from .const import (
     EVENT_ID,
     FRIGATE_RETRY_ATTEMPTS,
     FRIGATE_RETRY_SECONDS,
+    FRIGATE_SOURCE,
+    FRIGATE_LATENCY_BUDGET,
+    DEFAULT_FRIGATE_SOURCE,
+    DEFAULT_FRIGATE_LATENCY_BUDGET,
     INTERVAL,
     DURATION,
     MAX_FRAMES,
@@ -47,22 +56,84 @@ from .const import (
     GENERATE_TITLE,
     SENSOR_ENTITY,
     DATA_EXTRACTION_PROMPT,
+    FRAME_EXTRACTION,
+    DEFAULT_FRAME_EXTRACTION,
+    CONF_MAX_CONCURRENT_VIDEOS,
+    DEFAULT_MAX_CONCURRENT_VIDEOS,
+    DATA_VIDEO_SEMAPHORE,
+    CONF_CLIP_DOWNLOAD_TIMEOUT,
+    CONF_MAX_CLIP_SIZE,
+    DEFAULT_CLIP_DOWNLOAD_TIMEOUT,
+    DEFAULT_MAX_CLIP_SIZE,
+    DATA_CLIP_DOWNLOAD,
+    CONF_IMAGE_CACHE_SIZE,
+    CONF_IMAGE_CACHE_DISK_SIZE,
+    DEFAULT_IMAGE_CACHE_SIZE,
+    DEFAULT_IMAGE_CACHE_DISK_SIZE,
+    DATA_IMAGE_CACHE,
+    CONF_MEDIA_WORKERS,
+    DEFAULT_MEDIA_WORKERS,
+    DATA_MEDIA_WORKERS,
+    FRAME_SELECTION,
+    DEFAULT_FRAME_SELECTION,
+    IMAGE_FORMAT,
+    IMAGE_QUALITY,
+    CHROMA_SUBSAMPLING,
+    OPTIMIZE_IMAGES,
+    MAX_IMAGE_BYTES,
+    IMAGE_DETAIL,
+    DEFAULT_IMAGE_DETAIL,
+    CAPTURE_MODE,
+    DEFAULT_CAPTURE_MODE,
+    SAMPLE_RATE,
+    DEFAULT_SAMPLE_RATE,
+    FRAME_SAMPLING,
+    SAMPLE_COUNT,
+    SAMPLE_TIMESTAMPS,
+    DEFAULT_FRAME_SAMPLING,
+    DEFAULT_SAMPLE_COUNT,
+    MOTION_CROP,
+    DEFAULT_MOTION_CROP,
+    SKIP_UNCHANGED,
 )
 from .calendar import Timeline
 from .providers import Request
 from .memory import Memory
 from .media_handlers import MediaProcessor
+from .image_encoder import ImageEncoder
+from .sizing import SizingPolicy
+from .mosaic import Mosaic
+from .sampling import FrameSampling
+from .image_cache import ImageCache
+from .workers import MediaWorkers
 import re
 import os
+import asyncio
+import voluptuous as vol
 from datetime import timedelta
 from homeassistant.util import dt as dt_util
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
 from homeassistant.core import SupportsResponse
 from homeassistant.exceptions import ServiceValidationError
 import logging
 
 _LOGGER = logging.getLogger(__name__)
 
+CONFIG_SCHEMA = vol.Schema(
+    {
+        DOMAIN: vol.Schema({
+            vol.Optional(CONF_MAX_CONCURRENT_VIDEOS, default=DEFAULT_MAX_CONCURRENT_VIDEOS): vol.All(vol.Coerce(int), vol.Range(min=1)),
+            vol.Optional(CONF_CLIP_DOWNLOAD_TIMEOUT, default=DEFAULT_CLIP_DOWNLOAD_TIMEOUT): vol.All(vol.Coerce(int), vol.Range(min=1)),
+            vol.Optional(CONF_MAX_CLIP_SIZE, default=DEFAULT_MAX_CLIP_SIZE): vol.All(vol.Coerce(int), vol.Range(min=1)),
+            vol.Optional(CONF_IMAGE_CACHE_SIZE, default=DEFAULT_IMAGE_CACHE_SIZE): vol.All(vol.Coerce(int), vol.Range(min=0)),
+            vol.Optional(CONF_IMAGE_CACHE_DISK_SIZE, default=DEFAULT_IMAGE_CACHE_DISK_SIZE): vol.All(vol.Coerce(int), vol.Range(min=0)),
+            vol.Optional(CONF_MEDIA_WORKERS, default=DEFAULT_MEDIA_WORKERS): vol.All(vol.Coerce(int), vol.Range(min=1, max=16)),
+        })
+    },
+    extra=vol.ALLOW_EXTRA,
+)
+
 
 async def async_setup_entry(hass, entry):
     """Save config entry to hass.data"""
@@ -93,6 +164,13 @@ async def async_setup_entry(hass, entry):
     
     # Moondream specific
     moondream_image_selection = entry.data.get(CONF_MOONDREAM_IMAGE_SELECTION)
+
+    # Image encoder
+    image_format = entry.data.get(CONF_IMAGE_FORMAT)
+    image_quality = entry.data.get(CONF_IMAGE_QUALITY)
+    chroma_subsampling = entry.data.get(CONF_CHROMA_SUBSAMPLING)
+    optimize_images = entry.data.get(CONF_OPTIMIZE_IMAGES)
+    max_image_bytes = entry.data.get(CONF_MAX_IMAGE_BYTES)
     
     # Timeline
     retention_time = entry.data.get(CONF_RETENTION_TIME)
@@ -126,6 +204,11 @@ async def async_setup_entry(hass, entry):
         CONF_AWS_SECRET_ACCESS_KEY: aws_secret_access_key,
         CONF_AWS_REGION_NAME: aws_region_name,
         CONF_MOONDREAM_IMAGE_SELECTION: moondream_image_selection,
+        CONF_IMAGE_FORMAT: image_format,
+        CONF_IMAGE_QUALITY: image_quality,
+        CONF_CHROMA_SUBSAMPLING: chroma_subsampling,
+        CONF_OPTIMIZE_IMAGES: optimize_images,
+        CONF_MAX_IMAGE_BYTES: max_image_bytes,
         CONF_RETENTION_TIME: retention_time,
         CONF_MEMORY_PATHS: memory_paths,
         CONG_MEMORY_IMAGES_ENCODED: memory_images_encoded,
@@ -340,6 +423,10 @@ class ServiceCallData:
             data_call.data.get(FRIGATE_RETRY_ATTEMPTS, 2))
         self.frigate_retry_seconds = int(
             data_call.data.get(FRIGATE_RETRY_SECONDS, 1))
+        self.frigate_source = data_call.data.get(
+            FRIGATE_SOURCE, DEFAULT_FRIGATE_SOURCE)
+        self.frigate_latency_budget = float(data_call.data.get(
+            FRIGATE_LATENCY_BUDGET, DEFAULT_FRIGATE_LATENCY_BUDGET))
         self.max_frames = int(data_call.data.get(MAX_FRAMES, 3))
         self.target_width = data_call.data.get(TARGET_WIDTH, 3840)
         self.temperature = float()
@@ -348,6 +435,26 @@ class ServiceCallData:
         self.expose_images = data_call.data.get(EXPOSE_IMAGES, False)
         self.generate_title = data_call.data.get(GENERATE_TITLE, False)
         self.sensor_entity = data_call.data.get(SENSOR_ENTITY, "")
+        self.frame_extraction = data_call.data.get(
+            FRAME_EXTRACTION, DEFAULT_FRAME_EXTRACTION)
+        self.frame_selection = data_call.data.get(
+            FRAME_SELECTION, DEFAULT_FRAME_SELECTION)
+        # Encoder options fall back to the provider's configuration when not set
+        self.image_format = data_call.data.get(IMAGE_FORMAT)
+        self.image_quality = data_call.data.get(IMAGE_QUALITY)
+        self.chroma_subsampling = data_call.data.get(CHROMA_SUBSAMPLING)
+        self.optimize_images = data_call.data.get(OPTIMIZE_IMAGES)
+        self.max_image_bytes = data_call.data.get(MAX_IMAGE_BYTES)
+        self.image_detail = data_call.data.get(IMAGE_DETAIL, DEFAULT_IMAGE_DETAIL)
+        self.capture_mode = data_call.data.get(CAPTURE_MODE, DEFAULT_CAPTURE_MODE)
+        self.sample_rate = float(data_call.data.get(SAMPLE_RATE, DEFAULT_SAMPLE_RATE))
+        self.frame_sampling = data_call.data.get(
+            FRAME_SAMPLING, DEFAULT_FRAME_SAMPLING)
+        self.sample_count = int(data_call.data.get(
+            SAMPLE_COUNT, DEFAULT_SAMPLE_COUNT))
+        self.sample_timestamps = data_call.data.get(SAMPLE_TIMESTAMPS)
+        self.motion_crop = data_call.data.get(MOTION_CROP, DEFAULT_MOTION_CROP)
+        self.skip_unchanged = data_call.data.get(SKIP_UNCHANGED, False)
 
         # ------------ Remember ------------
         self.title = data_call.data.get("title")
@@ -361,7 +468,7 @@ class ServiceCallData:
         self.end_time = self._convert_time_input_to_datetime(self.end_time)
 
         # ------------ Added during call ------------
-        # self.base64_images : List[str] = []
+        # self.images : List[EncodedImage] = []
         # self.filenames : List[str] = []
 
     def _convert_time_input_to_datetime(self, time_input) -> datetime:
@@ -392,6 +499,35 @@ class ServiceCallData:
 
 
 def setup(hass, config):
+    # Shared limit for videos processed in parallel across all service calls
+    max_concurrent_videos = config.get(DOMAIN, {}).get(
+        CONF_MAX_CONCURRENT_VIDEOS, DEFAULT_MAX_CONCURRENT_VIDEOS)
+    hass.data[DATA_VIDEO_SEMAPHORE] = asyncio.Semaphore(max_concurrent_videos)
+    # Limits for streamed Frigate clip downloads
+    hass.data[DATA_CLIP_DOWNLOAD] = {
+        CONF_CLIP_DOWNLOAD_TIMEOUT: config.get(DOMAIN, {}).get(
+            CONF_CLIP_DOWNLOAD_TIMEOUT, DEFAULT_CLIP_DOWNLOAD_TIMEOUT),
+        CONF_MAX_CLIP_SIZE: config.get(DOMAIN, {}).get(
+            CONF_MAX_CLIP_SIZE, DEFAULT_MAX_CLIP_SIZE),
+    }
+    # Encoded images shared by all calls, keyed by the source bytes and encode settings
+    image_cache_size = config.get(DOMAIN, {}).get(
+        CONF_IMAGE_CACHE_SIZE, DEFAULT_IMAGE_CACHE_SIZE)
+    image_cache_disk_size = config.get(DOMAIN, {}).get(
+        CONF_IMAGE_CACHE_DISK_SIZE, DEFAULT_IMAGE_CACHE_DISK_SIZE)
+    if image_cache_size or image_cache_disk_size:
+        hass.data[DATA_IMAGE_CACHE] = ImageCache(
+            max_bytes=image_cache_size * 1024 * 1024,
+            path=hass.config.path(".storage", f"{DOMAIN}_image_cache"),
+            max_disk_bytes=image_cache_disk_size * 1024 * 1024,
+        )
+    # Image CPU work of all calls runs in this pool instead of the event loop or HA's executor
+    media_workers = MediaWorkers(config.get(DOMAIN, {}).get(
+        CONF_MEDIA_WORKERS, DEFAULT_MEDIA_WORKERS))
+    hass.data[DATA_MEDIA_WORKERS] = media_workers
+    hass.bus.listen_once(EVENT_HOMEASSISTANT_STOP,
+                         lambda event: media_workers.shutdown())
+
     async def image_analyzer(data_call):
         """Handle the service call to analyze an image with LLM Vision"""
         start = dt_util.now()
@@ -405,7 +541,10 @@ def setup(hass, config):
                           temperature=call.temperature,
                           )
         # Fetch and preprocess images
-        processor = MediaProcessor(hass, request)
+        processor = MediaProcessor(hass, request,
+                                   encoder=ImageEncoder.from_call(hass, call),
+                                   sizing=SizingPolicy.from_call(hass, call),
+                                   mosaic=Mosaic.from_call(hass, call))
         # Send images to RequestHandler client
         request = await processor.add_images(image_entities=call.image_entities,
                                              image_paths=call.image_paths,
@@ -441,7 +580,10 @@ def setup(hass, config):
                           max_tokens=call.max_tokens,
                           temperature=call.temperature,
                           )
-        processor = MediaProcessor(hass, request)
+        processor = MediaProcessor(hass, request,
+                                   encoder=ImageEncoder.from_call(hass, call),
+                                   sizing=SizingPolicy.from_call(hass, call),
+                                   mosaic=Mosaic.from_call(hass, call))
         request = await processor.add_videos(video_paths=call.video_paths,
                                              event_ids=call.event_id,
                                              max_frames=call.max_frames,
@@ -449,7 +591,13 @@ def setup(hass, config):
                                              include_filename=call.include_filename,
                                              expose_images=call.expose_images,
                                              frigate_retry_attempts=call.frigate_retry_attempts,
-                                             frigate_retry_seconds=call.frigate_retry_seconds
+                                             frigate_retry_seconds=call.frigate_retry_seconds,
+                                             frame_extraction=call.frame_extraction,
+                                             frame_selection=call.frame_selection,
+                                             frigate_source=call.frigate_source,
+                                             frigate_latency_budget=call.frigate_latency_budget,
+                                             sampling=FrameSampling.from_call(call),
+                                             motion_crop=call.motion_crop
                                              )
         call.memory = Memory(hass)
         await call.memory._update_memory()
@@ -476,7 +624,10 @@ def setup(hass, config):
                           max_tokens=call.max_tokens,
                           temperature=call.temperature,
                           )
-        processor = MediaProcessor(hass, request)
+        processor = MediaProcessor(hass, request,
+                                   encoder=ImageEncoder.from_call(hass, call),
+                                   sizing=SizingPolicy.from_call(hass, call),
+                                   mosaic=Mosaic.from_call(hass, call))
 
         request = await processor.add_streams(image_entities=call.image_entities,
                                               duration=call.duration,
@@ -484,8 +635,16 @@ def setup(hass, config):
                                               target_width=call.target_width,
                                               include_filename=call.include_filename,
                                               expose_images=call.expose_images,
+                                              frame_selection=call.frame_selection,
+                                              capture_mode=call.capture_mode,
+                                              sample_rate=call.sample_rate,
+                                              motion_crop=call.motion_crop,
                                               )
 
+        if call.skip_unchanged and not processor.departed:
+            _LOGGER.info("Skipped analysis, nothing departed from the background")
+            return {"response_text": "", "unchanged": True}
+
         call.memory = Memory(hass)
         await call.memory._update_memory()
 
@@ -540,7 +699,10 @@ def setup(hass, config):
                           max_tokens=call.max_tokens,
                           temperature=call.temperature,
                           )
-        processor = MediaProcessor(hass, request)
+        processor = MediaProcessor(hass, request,
+                                   encoder=ImageEncoder.from_call(hass, call),
+                                   sizing=SizingPolicy.from_call(hass, call),
+                                   mosaic=Mosaic.from_call(hass, call))
         request = await processor.add_visual_data(image_entities=call.image_entities,
                                                   image_paths=call.image_paths,
                                                   target_width=call.target_width,
@@ -0,0 +1,61 @@
+# capture.py
+# Seconds after the end of a recording in which a last snapshot may still arrive
+CAPTURE_GRACE = 2
+# Weight of the newest fetch in a camera's latency estimate
+LATENCY_SMOOTHING = 0.3
+
+
+class CaptureSchedule:
+    """
+    Capture deadlines of one camera while recording.
+
+    Tick n is due at start + n * interval, so time spent fetching and processing
+    never shifts later ticks. Fetches start early by the camera's expected latency
+    (an exponentially weighted average of its fetch times) to arrive on their tick.
+    Ticks that could only be started more than half an interval late are skipped
+    and counted as missed. After the first tick no fetch is started that isn't
+    expected to finish before the deadline, the end of the recording plus CAPTURE_GRACE.
+    """
+
+    def __init__(self, start, duration, interval, latency=None):
+        self.start = start
+        self.end = start + duration
+        self.deadline = self.end + CAPTURE_GRACE
+        self.interval = interval
+        self.latency = latency
+        self.tick = 0
+        self.captured = 0
+        self.missed = 0
+
+    def next_fetch(self, now):
+        """Time to start the fetch for the next tick at, None once recording is over"""
+        lead = self.latency or 0.0
+        while True:
+            due = self.start + self.tick * self.interval
+            if due > self.end:
+                return None
+            # Nothing can be fetched before the recording started
+            fetch_at = max(self.start, due - lead)
+            if now - fetch_at <= self.interval / 2:
+                # The first tick is always tried, so a camera that was slow once isn't skipped for good
+                if self.tick > 0 and max(now, fetch_at) + lead > self.deadline:
+                    return None
+                return max(now, fetch_at)
+            self.tick += 1
+            self.missed += 1
+
+    def remaining(self, now):
+        """Seconds left until the deadline"""
+        return max(0.0, self.deadline - now)
+
+    def fetched(self, latency, captured=True):
+        """Record the outcome of the fetch for the current tick and move to the next one"""
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+        if captured:
+            self.captured += 1
+        else:
+            self.missed += 1
+        self.tick += 1
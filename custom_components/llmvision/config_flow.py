@@ -53,10 +53,25 @@ from .const import (
     MOONDREAM_IMAGE_SELECTION_FIRST,
     MOONDREAM_IMAGE_SELECTION_LAST,
     MOONDREAM_IMAGE_SELECTION_BEST,
+    MOONDREAM_IMAGE_SELECTION_MOSAIC,
     ENDPOINT_OPENWEBUI,
     ENDPOINT_AZURE,
     ENDPOINT_GOOGLE,
     ENDPOINT_GROQ,
+    CONF_IMAGE_FORMAT,
+    CONF_IMAGE_QUALITY,
+    CONF_CHROMA_SUBSAMPLING,
+    CONF_OPTIMIZE_IMAGES,
+    CONF_MAX_IMAGE_BYTES,
+    IMAGE_FORMAT_JPEG,
+    IMAGE_FORMAT_WEBP,
+    DEFAULT_IMAGE_FORMAT,
+    DEFAULT_IMAGE_QUALITY,
+    CHROMA_SUBSAMPLING_444,
+    CHROMA_SUBSAMPLING_422,
+    CHROMA_SUBSAMPLING_420,
+    DEFAULT_CHROMA_SUBSAMPLING,
+    DEFAULT_MAX_IMAGE_BYTES,
 )
 import voluptuous as vol
 import os
@@ -65,6 +80,40 @@ import logging
 _LOGGER = logging.getLogger(__name__)
 
 
+def _encoder_schema(webp=False):
+    """Image encoder options shared by all provider steps"""
+    image_formats = [{"value": IMAGE_FORMAT_JPEG, "label": "JPEG"}]
+    if webp:
+        image_formats.append({"value": IMAGE_FORMAT_WEBP, "label": "WebP"})
+    return {
+        vol.Optional(CONF_IMAGE_FORMAT, default=DEFAULT_IMAGE_FORMAT): selector({
+            "select": {
+                "options": image_formats,
+                "mode": "dropdown"
+            }
+        }),
+        vol.Optional(CONF_IMAGE_QUALITY, default=DEFAULT_IMAGE_QUALITY): selector({
+            "number": {
+                "min": 1,
+                "max": 100,
+                "mode": "slider"
+            }
+        }),
+        vol.Optional(CONF_CHROMA_SUBSAMPLING, default=DEFAULT_CHROMA_SUBSAMPLING): selector({
+            "select": {
+                "options": [
+                    {"value": CHROMA_SUBSAMPLING_444, "label": "4:4:4 (full color detail)"},
+                    {"value": CHROMA_SUBSAMPLING_422, "label": "4:2:2"},
+                    {"value": CHROMA_SUBSAMPLING_420, "label": "4:2:0 (smallest)"}
+                ],
+                "mode": "dropdown"
+            }
+        }),
+        vol.Optional(CONF_OPTIMIZE_IMAGES, default=False): bool,
+        vol.Optional(CONF_MAX_IMAGE_BYTES, default=DEFAULT_MAX_IMAGE_BYTES): int,
+    }
+
+
 class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     VERSION = 3
@@ -127,11 +176,13 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     "options": [
                         {"value": MOONDREAM_IMAGE_SELECTION_FIRST, "label": "First image"},
                         {"value": MOONDREAM_IMAGE_SELECTION_LAST, "label": "Last image"},
-                        {"value": MOONDREAM_IMAGE_SELECTION_BEST, "label": "Best image (lowest SSIM score)"}
+                        {"value": MOONDREAM_IMAGE_SELECTION_BEST, "label": "Best image (lowest SSIM score)"},
+                        {"value": MOONDREAM_IMAGE_SELECTION_MOSAIC, "label": "All images in one grid"}
                     ],
                     "mode": "dropdown"
                 }
             }),
+            **_encoder_schema(),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -182,6 +233,7 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             vol.Optional(CONF_DEFAULT_MODEL, default=DEFAULT_LOCALAI_MODEL): str,
             vol.Optional(CONF_TEMPERATURE, default=0.5): float,
             vol.Optional(CONF_TOP_P, default=0.9): float,
+            **_encoder_schema(),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -233,6 +285,7 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             vol.Required(CONF_DEFAULT_MODEL, default=DEFAULT_OLLAMA_MODEL): str,
             vol.Optional(CONF_TEMPERATURE, default=0.5): float,
             vol.Optional(CONF_TOP_P, default=0.9): float,
+            **_encoder_schema(),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -285,6 +338,7 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             vol.Required(CONF_DEFAULT_MODEL, default=DEFAULT_OPENWEBUI_MODEL): str,
             vol.Optional(CONF_TEMPERATURE, default=0.5): float,
             vol.Optional(CONF_TOP_P, default=0.9): float,
+            **_encoder_schema(),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -338,6 +392,7 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             vol.Optional(CONF_DEFAULT_MODEL, default=DEFAULT_OPENAI_MODEL): str,
             vol.Optional(CONF_TEMPERATURE, default=0.5): float,
             vol.Optional(CONF_TOP_P, default=0.9): float,
+            **_encoder_schema(webp=True),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -388,6 +443,7 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             vol.Optional(CONF_DEFAULT_MODEL, default=DEFAULT_AZURE_MODEL): str,
             vol.Optional(CONF_TEMPERATURE, default=0.5): float,
             vol.Optional(CONF_TOP_P, default=0.9): float,
+            **_encoder_schema(webp=True),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -439,6 +495,7 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             vol.Optional(CONF_DEFAULT_MODEL, default=DEFAULT_ANTHROPIC_MODEL): str,
             vol.Optional(CONF_TEMPERATURE, default=0.5): float,
             vol.Optional(CONF_TOP_P, default=0.9): float,
+            **_encoder_schema(webp=True),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -486,6 +543,7 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             vol.Optional(CONF_DEFAULT_MODEL, default=DEFAULT_GOOGLE_MODEL): str,
             vol.Optional(CONF_TEMPERATURE, default=0.5): float,
             vol.Optional(CONF_TOP_P, default=0.9): float,
+            **_encoder_schema(webp=True),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -532,6 +590,7 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             vol.Optional(CONF_DEFAULT_MODEL, default=DEFAULT_GROQ_MODEL): str,
             vol.Optional(CONF_TEMPERATURE, default=0.5): float,
             vol.Optional(CONF_TOP_P, default=0.9): float,
+            **_encoder_schema(),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -577,7 +636,8 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             vol.Required(CONF_API_KEY): str,
             vol.Required(CONF_DEFAULT_MODEL, default=DEFAULT_CUSTOM_OPENAI_MODEL): str,
             vol.Optional(CONF_TEMPERATURE, default=0.5): float,
-            vol.Optional(CONF_TOP_P, default=0.9): float
+            vol.Optional(CONF_TOP_P, default=0.9): float,
+            **_encoder_schema(),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -631,6 +691,7 @@ class llmvisionConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             vol.Required(CONF_DEFAULT_MODEL, default=DEFAULT_AWS_MODEL): str,
             vol.Optional(CONF_TEMPERATURE, default=0.5): float,
             vol.Optional(CONF_TOP_P, default=0.9): float,
+            **_encoder_schema(webp=True),
         })
 
         if self.source == config_entries.SOURCE_RECONFIGURE:
@@ -3,6 +3,13 @@
 
 # Global constants
 DOMAIN = "llmvision"
+DATA_VIDEO_SEMAPHORE = f"{DOMAIN}_video_semaphore"
+DATA_CAPTURE_LATENCY = f"{DOMAIN}_capture_latency"
+DATA_CLIP_DOWNLOAD = f"{DOMAIN}_clip_download"
+DATA_FRIGATE_LATENCY = f"{DOMAIN}_frigate_latency"
+DATA_IMAGE_CACHE = f"{DOMAIN}_image_cache"
+DATA_BACKGROUND_MODELS = f"{DOMAIN}_background_models"
+DATA_MEDIA_WORKERS = f"{DOMAIN}_media_workers"
 
 # CONFIGURABLE VARIABLES FOR SETUP
 CONF_PROVIDER = 'conf_provider'
@@ -30,6 +37,13 @@ CONF_CUSTOM_OPENAI_ENDPOINT = 'custom_openai_endpoint'
 # Moondream specific
 CONF_MOONDREAM_IMAGE_SELECTION = 'moondream_image_selection'
 
+# Image encoder
+CONF_IMAGE_FORMAT = 'image_format'
+CONF_IMAGE_QUALITY = 'image_quality'
+CONF_CHROMA_SUBSAMPLING = 'chroma_subsampling'
+CONF_OPTIMIZE_IMAGES = 'optimize_images'
+CONF_MAX_IMAGE_BYTES = 'max_image_bytes'
+
 # Timeline
 CONF_RETENTION_TIME = 'retention_time'
 
@@ -40,6 +54,14 @@ CONF_MEMORY_STRINGS = 'memory_strings'
 CONF_SYSTEM_PROMPT = 'system_prompt'
 CONF_TITLE_PROMPT = 'title_prompt'
 
+# configuration.yaml
+CONF_MAX_CONCURRENT_VIDEOS = 'max_concurrent_videos'
+CONF_CLIP_DOWNLOAD_TIMEOUT = 'clip_download_timeout'
+CONF_MAX_CLIP_SIZE = 'max_clip_size'
+CONF_IMAGE_CACHE_SIZE = 'image_cache_size'
+CONF_IMAGE_CACHE_DISK_SIZE = 'image_cache_disk_size'
+CONF_MEDIA_WORKERS = 'media_workers'
+
 
 # SERVICE CALL CONSTANTS
 MESSAGE = 'message'
@@ -55,13 +77,30 @@ VIDEO_FILE = 'video_file'
 EVENT_ID = 'event_id'
 INTERVAL = 'interval'
 DURATION = 'duration'
+CAPTURE_MODE = 'capture_mode'
+SAMPLE_RATE = 'sample_rate'
 FRIGATE_RETRY_ATTEMPTS = 'frigate_retry_attempts'
 FRIGATE_RETRY_SECONDS = 'frigate_retry_seconds'
+FRIGATE_SOURCE = 'frigate_source'
+FRIGATE_LATENCY_BUDGET = 'frigate_latency_budget'
 MAX_FRAMES = 'max_frames'
 INCLUDE_FILENAME = 'include_filename'
 EXPOSE_IMAGES = 'expose_images'
 GENERATE_TITLE = 'generate_title'
 SENSOR_ENTITY = 'sensor_entity'
+FRAME_EXTRACTION = 'frame_extraction'
+FRAME_SELECTION = 'frame_selection'
+FRAME_SAMPLING = 'frame_sampling'
+SAMPLE_COUNT = 'sample_count'
+SAMPLE_TIMESTAMPS = 'sample_timestamps'
+MOTION_CROP = 'motion_crop'
+SKIP_UNCHANGED = 'skip_unchanged'
+IMAGE_FORMAT = 'image_format'
+IMAGE_QUALITY = 'image_quality'
+CHROMA_SUBSAMPLING = 'chroma_subsampling'
+OPTIMIZE_IMAGES = 'optimize_images'
+MAX_IMAGE_BYTES = 'max_image_bytes'
+IMAGE_DETAIL = 'image_detail'
 
 # Error messages
 ERROR_NOT_CONFIGURED = "{provider} is not configured"
@@ -96,7 +135,80 @@ DEFAULT_MOONDREAM_MODEL = "moondream2"
 MOONDREAM_IMAGE_SELECTION_FIRST = "first"
 MOONDREAM_IMAGE_SELECTION_LAST = "last"
 MOONDREAM_IMAGE_SELECTION_BEST = "best"
-DEFAULT_MOONDREAM_IMAGE_SELECTION = MOONDREAM_IMAGE_SELECTION_FIRST
+# All images tiled into one grid, see mosaic.py
+MOONDREAM_IMAGE_SELECTION_MOSAIC = "mosaic"
+DEFAULT_MOONDREAM_IMAGE_SELECTION = MOONDREAM_IMAGE_SELECTION_MOSAIC
+
+# Frame extraction modes for videos
+FRAME_EXTRACTION_PIPE = "pipe"
+FRAME_EXTRACTION_DISK = "disk"
+FRAME_EXTRACTION_TWO_PASS = "two_pass"
+DEFAULT_FRAME_EXTRACTION = FRAME_EXTRACTION_PIPE
+DEFAULT_MAX_CONCURRENT_VIDEOS = 2
+# Frigate clip downloads: seconds for the whole download and size cap in MB
+DEFAULT_CLIP_DOWNLOAD_TIMEOUT = 60
+DEFAULT_MAX_CLIP_SIZE = 100
+# Encoded image cache in MB, in memory and in .storage (0 disables a tier)
+DEFAULT_IMAGE_CACHE_SIZE = 32
+DEFAULT_IMAGE_CACHE_DISK_SIZE = 0
+# Threads for image decoding, scoring and encoding shared by all calls
+DEFAULT_MEDIA_WORKERS = 2
+
+# Frame selection methods for videos and streams
+FRAME_SELECTION_SSIM = "ssim"
+FRAME_SELECTION_PHASH = "phash"
+FRAME_SELECTION_BACKGROUND = "background"
+DEFAULT_FRAME_SELECTION = FRAME_SELECTION_SSIM
+
+# Which frames of a video are decoded
+FRAME_SAMPLING_KEYFRAMES = "keyframes"
+FRAME_SAMPLING_COUNT = "count"
+FRAME_SAMPLING_FPS = "fps"
+FRAME_SAMPLING_TIMESTAMPS = "timestamps"
+DEFAULT_FRAME_SAMPLING = FRAME_SAMPLING_KEYFRAMES
+DEFAULT_SAMPLE_COUNT = 10
+
+# Cropping of selected frames to the region that changed
+MOTION_CROP_OFF = "off"
+MOTION_CROP_CROP = "crop"
+MOTION_CROP_CONTEXT = "crop_with_context"
+DEFAULT_MOTION_CROP = MOTION_CROP_OFF
+
+# How stream_analyzer captures frames
+CAPTURE_MODE_SNAPSHOT = "snapshot"
+CAPTURE_MODE_STREAM = "stream"
+DEFAULT_CAPTURE_MODE = CAPTURE_MODE_SNAPSHOT
+# Frames per second sampled in stream capture mode
+DEFAULT_SAMPLE_RATE = 1
+
+# What video_analyzer fetches from Frigate for an event
+FRIGATE_SOURCE_AUTO = "auto"
+FRIGATE_SOURCE_CLIP = "clip"
+FRIGATE_SOURCE_PREVIEW = "preview"
+FRIGATE_SOURCE_SNAPSHOT = "snapshot"
+DEFAULT_FRIGATE_SOURCE = FRIGATE_SOURCE_CLIP
+# Seconds an event may take in auto mode, 0 for no limit
+DEFAULT_FRIGATE_LATENCY_BUDGET = 0
+
+# Output image encoding
+IMAGE_FORMAT_JPEG = "jpeg"
+IMAGE_FORMAT_WEBP = "webp"
+DEFAULT_IMAGE_FORMAT = IMAGE_FORMAT_JPEG
+# Pillow's defaults, so images are encoded as before unless configured
+DEFAULT_IMAGE_QUALITY = 75
+CHROMA_SUBSAMPLING_444 = "4:4:4"
+CHROMA_SUBSAMPLING_422 = "4:2:2"
+CHROMA_SUBSAMPLING_420 = "4:2:0"
+DEFAULT_CHROMA_SUBSAMPLING = CHROMA_SUBSAMPLING_420
+DEFAULT_MAX_IMAGE_BYTES = 0
+# Providers that accept WebP images, others always get JPEG
+WEBP_PROVIDERS = ("OpenAI", "Azure", "Anthropic", "Google", "AWS Bedrock")
+
+# Detail levels images are sized for, see sizing.py
+IMAGE_DETAIL_LOW = "low"
+IMAGE_DETAIL_MEDIUM = "medium"
+IMAGE_DETAIL_HIGH = "high"
+DEFAULT_IMAGE_DETAIL = IMAGE_DETAIL_HIGH
 
 # API Endpoints
 ENDPOINT_OPENAI = "https://api.openai.com/v1/chat/completions"
@@ -0,0 +1,528 @@
+# frame_analysis.py
+import time
+import threading
+import numpy as np
+from PIL import Image
+
+from .const import FRAME_SELECTION_PHASH, FRAME_SELECTION_BACKGROUND
+
+# Width frames are downscaled to before they are compared
+SCORING_WIDTH = 320
+# Frames whose hashes differ in at most this many bits are considered duplicates
+PHASH_DUPLICATE_DISTANCE = 4
+# SSIM below which a window counts as changed
+MOTION_SSIM_THRESHOLD = 0.4
+# Windows that must change for a frame to have a motion box, as a share of all windows
+MOTION_MIN_CHANGE = 0.002
+# Share of changed windows ignored on each side of the motion box, drops isolated noise
+MOTION_OUTLIERS = 0.02
+# Margin added on each side of the motion box, as a share of its size
+MOTION_MARGIN = 0.25
+# Crops are at least this share of the frame's width and height
+MOTION_MIN_SIZE = 0.25
+# Frames are not cropped when the crop would cover more than this share of them
+MOTION_MAX_AREA = 0.5
+# Frames at least this share as sharp as the source's running average count as fully sharp
+SHARPNESS_TOLERANCE = 0.5
+# Weight of the newest frame in the running average of the sharpness
+SHARPNESS_SMOOTHING = 0.2
+# Pixel values at or beyond these count as clipped to black or white
+CLIP_BLACK = 3
+CLIP_WHITE = 252
+# Share of clipped pixels exposure quality starts to drop at, and is 0 at
+CLIP_ALLOWED = 0.3
+CLIP_MAX = 0.9
+# Added to the score of a frame pair at quality 0 relative to the source's best frame,
+# so useless frames lose to any usable one
+QUALITY_PENALTY = 1.0
+# Time buckets kept per selected frame while frames are offered
+BUCKETS_PER_FRAME = 4
+# Frames whose change is below this share of the spread between the best and worst scores aren't picked
+DIVERSITY_MIN_CHANGE = 0.25
+# Weight of each frame in a camera's background, and the factor for windows that departed from it
+BACKGROUND_LEARNING_RATE = 0.1
+BACKGROUND_DEPARTED_RATE = 0.1
+# Backgrounds start over after this many seconds without frames, or when the mean brightness
+# changed more than this, e.g. between day and night
+BACKGROUND_MAX_AGE = 3600
+BACKGROUND_MAX_BRIGHTNESS_CHANGE = 40
+
+
+def prepare_frame(img, width=SCORING_WIDTH):
+    """Downscale an image and return it as a grayscale uint8 array for scoring"""
+    # Converted first, reduce() doesn't support palette and 16-bit images
+    if img.mode != 'L':
+        img = img.convert('L')
+    factor = max(1, img.width // width)
+    if factor > 1:
+        img = img.reduce(factor)
+    return np.asarray(img)
+
+
+class SSIMEngine:
+    """
+    Windowed, multi-scale SSIM on downscaled grayscale frames.
+
+    Local statistics are computed with box windows from running sums, so the cost
+    is linear in the number of pixels regardless of the window size. Working
+    buffers are float32 and reused as long as the frame size doesn't change.
+
+    SSIM by Z. Wang: https://ece.uwaterloo.ca/~z70wang/research/ssim/
+    Paper:  Z. Wang, A. C. Bovik, H. R. Sheikh and E. P. Simoncelli,
+    "Image quality assessment: From error visibility to structural similarity," IEEE Transactions on Image Processing, vol. 13, no. 4, pp. 600-612, Apr. 2004.
+    """
+
+    K1 = 0.005
+    K2 = 0.015
+    L = 255
+
+    def __init__(self, window=7, levels=2):
+        self.window = window
+        self.levels = levels
+        self.C1 = (self.K1 * self.L) ** 2
+        self.C2 = (self.K2 * self.L) ** 2
+        self._buffers = {}
+        # SSIM map of the finest level from the last comparison
+        self.ssim_map = None
+
+    def _get_buffers(self, shape):
+        """Allocate working buffers once per frame shape"""
+        if shape not in self._buffers:
+            h, w = shape
+            win = self.window
+            oh, ow = h - win + 1, w - win + 1
+            self._buffers[shape] = {
+                "x": np.empty((h, w), dtype=np.float32),
+                "y": np.empty((h, w), dtype=np.float32),
+                "prod": np.empty((h, w), dtype=np.float32),
+                "rows": np.zeros((h, w + 1), dtype=np.float32),
+                "cols": np.zeros((h, ow), dtype=np.float32),
+                "acc": np.zeros((h + 1, ow), dtype=np.float32),
+                "mu_x": np.empty((oh, ow), dtype=np.float32),
+                "mu_y": np.empty((oh, ow), dtype=np.float32),
+                "xx": np.empty((oh, ow), dtype=np.float32),
+                "yy": np.empty((oh, ow), dtype=np.float32),
+                "xy": np.empty((oh, ow), dtype=np.float32),
+                "num": np.empty((oh, ow), dtype=np.float32),
+                "den": np.empty((oh, ow), dtype=np.float32),
+            }
+        return self._buffers[shape]
+
+    def _box_mean(self, src, out, buf):
+        """Mean over every window x window block of src ('valid' region) into out"""
+        win = self.window
+        rows, cols, acc = buf["rows"], buf["cols"], buf["acc"]
+        np.cumsum(src, axis=1, out=rows[:, 1:])
+        np.subtract(rows[:, win:], rows[:, :-win], out=cols)
+        np.cumsum(cols, axis=0, out=acc[1:])
+        np.subtract(acc[win:], acc[:-win], out=out)
+        out *= 1.0 / (win * win)
+        return out
+
+    def _ssim_level(self, x_img, y_img):
+        """SSIM map of two equally sized uint8 or float arrays"""
+        buf = self._get_buffers(x_img.shape)
+        x, y, prod = buf["x"], buf["y"], buf["prod"]
+        # Center around zero to keep the running sums accurate in float32
+        np.subtract(x_img, 128, out=x, dtype=np.float32)
+        np.subtract(y_img, 128, out=y, dtype=np.float32)
+
+        mu_x = self._box_mean(x, buf["mu_x"], buf)
+        mu_y = self._box_mean(y, buf["mu_y"], buf)
+        np.multiply(x, x, out=prod)
+        xx = self._box_mean(prod, buf["xx"], buf)
+        np.multiply(y, y, out=prod)
+        yy = self._box_mean(prod, buf["yy"], buf)
+        np.multiply(x, y, out=prod)
+        xy = self._box_mean(prod, buf["xy"], buf)
+
+        # Local (co)variances, variance is unaffected by the shift above
+        xx -= mu_x * mu_x
+        yy -= mu_y * mu_y
+        xy -= mu_x * mu_y
+        mu_x += 128
+        mu_y += 128
+
+        num, den = buf["num"], buf["den"]
+        # (2 * mu_x * mu_y + C1) * (2 * sigma_xy + C2)
+        np.multiply(mu_x, mu_y, out=num)
+        num *= 2
+        num += self.C1
+        xy *= 2
+        xy += self.C2
+        num *= xy
+        # (mu_x^2 + mu_y^2 + C1) * (sigma_x^2 + sigma_y^2 + C2)
+        np.multiply(mu_x, mu_x, out=den)
+        mu_y *= mu_y
+        den += mu_y
+        den += self.C1
+        xx += yy
+        xx += self.C2
+        den *= xx
+        num /= den
+        return num
+
+    def score(self, previous_frame, current_frame):
+        """Mean SSIM of two prepared frames across all pyramid levels (1 means identical)"""
+        if previous_frame.shape != current_frame.shape:
+            h = min(previous_frame.shape[0], current_frame.shape[0])
+            w = min(previous_frame.shape[1], current_frame.shape[1])
+            previous_frame = previous_frame[:h, :w]
+            current_frame = current_frame[:h, :w]
+
+        scores = []
+        x_img, y_img = previous_frame, current_frame
+        for level in range(self.levels):
+            h, w = x_img.shape
+            if min(h, w) < self.window:
+                break
+            ssim_map = self._ssim_level(x_img, y_img)
+            if level == 0:
+                self.ssim_map = ssim_map
+            scores.append(float(ssim_map.mean(dtype=np.float64)))
+            # Next pyramid level: 2x2 mean pooling
+            h, w = h // 2 * 2, w // 2 * 2
+            x_img = x_img[:h, :w].reshape(h // 2, 2, w // 2, 2).mean(
+                axis=(1, 3), dtype=np.float32)
+            y_img = y_img[:h, :w].reshape(h // 2, 2, w // 2, 2).mean(
+                axis=(1, 3), dtype=np.float32)
+
+        if not scores:
+            # Frames smaller than the window can only be compared globally
+            return 1.0 if np.array_equal(previous_frame, current_frame) else 0.0
+        return sum(scores) / len(scores)
+
+
+def motion_box(ssim_map, window):
+    """
+    Bounding box (left, top, right, bottom) of the changed windows of an SSIM map,
+    as shares of the frame's width and height, None if too little changed.
+    """
+    rows, cols = np.nonzero(ssim_map < MOTION_SSIM_THRESHOLD)
+    if len(rows) < max(1, MOTION_MIN_CHANGE * ssim_map.size):
+        return None
+    # Window (i, j) covers pixels i to i + window of the compared frames
+    height = ssim_map.shape[0] + window - 1
+    width = ssim_map.shape[1] + window - 1
+    top, bottom = np.quantile(rows, (MOTION_OUTLIERS, 1 - MOTION_OUTLIERS))
+    left, right = np.quantile(cols, (MOTION_OUTLIERS, 1 - MOTION_OUTLIERS))
+    return (float(left / width), float(top / height),
+            float(min(1.0, (right + window) / width)), float(min(1.0, (bottom + window) / height)))
+
+
+def motion_crop(box, size):
+    """
+    Pixel box (left, upper, right, lower) to crop a frame of size to its motion box
+    with a margin, None if the crop would cover most of the frame anyway.
+    """
+    def expand(low, high):
+        padding = max((high - low) * MOTION_MARGIN, (MOTION_MIN_SIZE - (high - low)) / 2)
+        low, high = low - padding, high + padding
+        # Shift crops that run over an edge back into the frame
+        if low < 0:
+            low, high = 0.0, min(1.0, high - low)
+        if high > 1:
+            low, high = max(0.0, low - (high - 1)), 1.0
+        return low, high
+
+    left, right = expand(box[0], box[2])
+    top, bottom = expand(box[1], box[3])
+    if (right - left) * (bottom - top) > MOTION_MAX_AREA:
+        return None
+    width, height = size
+    return (round(left * width), round(top * height), round(right * width), round(bottom * height))
+
+
+class FrameQuality:
+    """
+    Sharpness and exposure of the prepared frames of one source, from 0 (useless) to 1.
+
+    Sharpness is the variance of the Laplacian relative to the running average of
+    the source, so motion blur and focus hunting stand out regardless of how much
+    detail the scene has. Exposure drops as more pixels are clipped to black or
+    white, as in over-exposed frames and frames taken while a camera switches to
+    or from infrared.
+
+    Quality is relative to the best frame of the source so far, so a source that is
+    dark or clipped throughout isn't penalized, only frames worse than it can be.
+    """
+
+    def __init__(self):
+        self.reference = None
+        self.best = 0.0
+
+    def sharpness(self, frame):
+        """Variance of the 4-neighbour Laplacian"""
+        f = frame.astype(np.float32)
+        laplacian = 4 * f[1:-1, 1:-1]
+        laplacian -= f[:-2, 1:-1]
+        laplacian -= f[2:, 1:-1]
+        laplacian -= f[1:-1, :-2]
+        laplacian -= f[1:-1, 2:]
+        return float(laplacian.var(dtype=np.float64))
+
+    def measure(self, frame):
+        """Quality of a prepared frame, updates the running average sharpness"""
+        if min(frame.shape) < 3:
+            return 1.0
+        sharpness = self.sharpness(frame)
+        if self.reference is None:
+            self.reference = sharpness
+        sharp = 1.0 if not self.reference else min(1.0, sharpness / (self.reference * SHARPNESS_TOLERANCE))
+        self.reference += SHARPNESS_SMOOTHING * (sharpness - self.reference)
+
+        histogram = np.bincount(frame.ravel(), minlength=256)
+        clipped = float(histogram[:CLIP_BLACK + 1].sum() + histogram[CLIP_WHITE:].sum()) / frame.size
+        exposed = min(1.0, max(0.0, (CLIP_MAX - clipped) / (CLIP_MAX - CLIP_ALLOWED)))
+        quality = sharp * exposed
+        self.best = max(self.best, quality)
+        return quality / self.best if self.best else 1.0
+
+
+def quality_penalty(quality):
+    """Score added to a frame pair of the given quality"""
+    return QUALITY_PENALTY * (1 - quality)
+
+
+def dhash(img, hash_size=8):
+    """64-bit difference hash of an image from a tiny grayscale thumbnail"""
+    thumbnail = img.resize((hash_size + 1, hash_size),
+                           Image.BILINEAR, reducing_gap=2.0).convert('L')
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(hash_a, hash_b):
+    return (hash_a ^ hash_b).bit_count()
+
+
+class SSIMScorer:
+    """
+    Scores each frame by its SSIM to the previous frame.
+
+    Blurred or badly exposed frames look very different from their neighbours, so
+    the score is raised by the quality penalty of the worse of the two frames.
+    After each comparison motion_box holds the region that changed between the
+    two frames, see motion_box().
+    """
+
+    def __init__(self):
+        self.engine = SSIMEngine()
+        self.quality = FrameQuality()
+        self.previous_frame = None
+        self.previous_quality = None
+        self.motion_box = None
+
+    def score(self, img):
+        """Returns (keep, score), score is None for the first frame"""
+        current_frame = prepare_frame(img)
+        quality = self.quality.measure(current_frame)
+        previous_frame, self.previous_frame = self.previous_frame, current_frame
+        previous_quality, self.previous_quality = self.previous_quality, quality
+        self.motion_box = None
+        if previous_frame is None:
+            return True, None
+        self.engine.ssim_map = None
+        score = self.engine.score(previous_frame, current_frame)
+        if self.engine.ssim_map is not None:
+            self.motion_box = motion_box(self.engine.ssim_map, self.engine.window)
+        return True, score + quality_penalty(min(quality, previous_quality))
+
+
+class BackgroundModel:
+    """
+    Running average of the prepared frames of one camera, kept across service calls.
+
+    Windows that match the background are blended in at BACKGROUND_LEARNING_RATE,
+    windows that departed from it only at a fraction of that, so passing objects
+    don't become background while parked cars and gradual lighting changes do.
+    """
+
+    def __init__(self):
+        self.background = None
+        self.updated = None
+        self._lock = threading.Lock()
+
+    def get(self, frame):
+        """
+        Copy of the background to compare a prepared frame to. Returns None and starts
+        over from the frame if there is no usable background.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if (self.background is None or self.background.shape != frame.shape
+                    or now - self.updated > BACKGROUND_MAX_AGE
+                    or abs(float(frame.mean()) - float(self.background.mean())) > BACKGROUND_MAX_BRIGHTNESS_CHANGE):
+                self.background = frame.astype(np.float32)
+                self.updated = now
+                return None
+            return self.background.copy()
+
+    def update(self, frame, departed=None):
+        """Blend a prepared frame into the background, departed marks pixels that differ from it"""
+        with self._lock:
+            if self.background is None or self.background.shape != frame.shape:
+                return
+            rate = BACKGROUND_LEARNING_RATE
+            if departed is not None:
+                rate = np.where(departed, BACKGROUND_LEARNING_RATE * BACKGROUND_DEPARTED_RATE, rate)
+            self.background += rate * (frame - self.background)
+            self.updated = time.monotonic()
+
+
+class BackgroundScorer:
+    """
+    Scores each frame by its SSIM to the camera's background, plus its quality penalty.
+
+    Slow objects that barely move between frames still stand out from the background.
+    After each comparison motion_box holds the region that departed from it. The first
+    frame is only scored if the background model already has a usable background.
+    """
+
+    def __init__(self, model=None):
+        self.engine = SSIMEngine()
+        self.quality = FrameQuality()
+        self.model = model or BackgroundModel()
+        self.motion_box = None
+
+    def _departed(self, shape):
+        """Pixels of a frame of shape covered by the center of a changed SSIM window"""
+        changed = self.engine.ssim_map < MOTION_SSIM_THRESHOLD
+        before = self.engine.window // 2
+        after = self.engine.window - 1 - before
+        changed = np.pad(changed, ((before, after), (before, after)), mode='edge')
+        return changed if changed.shape == shape else None
+
+    def score(self, img):
+        """Returns (keep, score), score is None while there is no background"""
+        current_frame = prepare_frame(img)
+        quality = self.quality.measure(current_frame)
+        self.motion_box = None
+        background = self.model.get(current_frame)
+        if background is None:
+            return True, None
+        self.engine.ssim_map = None
+        score = self.engine.score(background, current_frame)
+        departed = None
+        if self.engine.ssim_map is not None:
+            self.motion_box = motion_box(self.engine.ssim_map, self.engine.window)
+            departed = self._departed(current_frame.shape)
+        self.model.update(current_frame, departed)
+        return True, score + quality_penalty(quality)
+
+
+class PerceptualHashScorer:
+    """
+    Clusters frames by the Hamming distance of their dHash.
+
+    Frames close to an already seen frame are dropped as duplicates. Other frames
+    are scored by their distance to the closest seen frame, scaled like SSIM so
+    lower scores mean more change, plus the quality penalty of the worse of the
+    frame and the previous kept frame.
+    """
+
+    def __init__(self, max_distance=PHASH_DUPLICATE_DISTANCE):
+        self.max_distance = max_distance
+        self.hashes = []
+        self.quality = FrameQuality()
+        self.previous_quality = None
+        # Hashes don't locate changes, frames are never cropped to motion
+        self.motion_box = None
+
+    def score(self, img):
+        """Returns (keep, score), score is None for the first frame"""
+        frame_hash = dhash(img)
+        if not self.hashes:
+            self.hashes.append(frame_hash)
+            self.previous_quality = self.quality.measure(prepare_frame(img))
+            return True, None
+        distance = min(hamming_distance(frame_hash, seen)
+                       for seen in self.hashes)
+        if distance <= self.max_distance:
+            return False, None
+        self.hashes.append(frame_hash)
+        quality = self.quality.measure(prepare_frame(img))
+        previous_quality, self.previous_quality = self.previous_quality, quality
+        return True, 1 - distance / 64 + quality_penalty(min(quality, previous_quality))
+
+
+class DiverseFrames:
+    """
+    Picks max_frames frames with large changes spread over the whole recording.
+
+    Frames are offered in time order into equal-width time buckets, each keeping
+    only its lowest score. Once there are more than BUCKETS_PER_FRAME buckets per
+    frame, adjacent buckets are merged and the width doubles, so memory stays
+    bounded by the number of buckets. frames() splits the time span into max_frames
+    segments and takes the best frame of each. Slots of segments that barely changed
+    go to the lowest remaining scores instead, so a single burst can still fill them.
+
+    Change is measured from the worst score, since quality penalties can push scores
+    past 1. Frames that barely changed are never picked, so fewer than max_frames
+    frames are returned when only a short part of the recording changed, but the
+    best frame always is. Ties keep the earlier frame.
+    """
+
+    def __init__(self, max_frames):
+        self.max_frames = max_frames
+        # bucket index -> (score, position, label, frame)
+        self._buckets = {}
+        self._width = 1
+        self._position = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def offer(self, score, label, frame):
+        """Add a frame if it is the best of its time bucket so far, returns whether it was kept"""
+        if self.max_frames <= 0:
+            return False
+        position = self._position
+        self._position += 1
+        while position // self._width >= self.max_frames * BUCKETS_PER_FRAME:
+            self._merge()
+        index = position // self._width
+        kept = self._buckets.get(index)
+        if kept is not None and kept[0] <= score:
+            return False
+        # Positions are unique, so entries never compare frames
+        self._buckets[index] = (score, position, label, frame)
+        return True
+
+    def _merge(self):
+        buckets = {}
+        for index, entry in self._buckets.items():
+            kept = buckets.get(index // 2)
+            if kept is None or entry[:2] < kept[:2]:
+                buckets[index // 2] = entry
+        self._buckets = buckets
+        self._width *= 2
+
+    def frames(self):
+        """(label, frame, score) of the selected frames in the order they were offered"""
+        entries = list(self._buckets.values())
+        if len(entries) > self.max_frames:
+            segments = {}
+            for entry in entries:
+                segment = entry[1] * self.max_frames // self._position
+                if segment not in segments or entry[:2] < segments[segment][:2]:
+                    segments[segment] = entry
+            # The best frame always passes, its change is the whole spread
+            worst_score = max(entry[0] for entry in entries)
+            min_change = DIVERSITY_MIN_CHANGE * (worst_score - min(entry[0] for entry in entries))
+            selected = [entry for entry in segments.values() if worst_score - entry[0] >= min_change]
+            positions = {entry[1] for entry in selected}
+            remaining = sorted(entry for entry in entries
+                               if entry[1] not in positions and worst_score - entry[0] >= min_change)
+            entries = selected + remaining[:self.max_frames - len(selected)]
+        return [(label, frame, score) for score, _, label, frame in sorted(entries, key=lambda entry: entry[1])]
+
+
+def create_scorer(frame_selection, background=None):
+    """Scorer for the frame_selection option of a service call, background is the camera's BackgroundModel"""
+    if frame_selection == FRAME_SELECTION_PHASH:
+        return PerceptualHashScorer()
+    if frame_selection == FRAME_SELECTION_BACKGROUND:
+        return BackgroundScorer(background)
+    return SSIMScorer()
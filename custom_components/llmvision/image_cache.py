@@ -0,0 +1,138 @@
+# image_cache.py
+"""
+Cache of encoded images.
+
+Entries are keyed by a hash of the source bytes together with everything that
+affects the encoding (size, format, quality), so a changed file or snapshot is a
+new entry and never needs to be invalidated. Recently used entries are kept in
+memory up to a byte budget, and optionally in a larger directory under .storage
+that survives restarts.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+_LOGGER = logging.getLogger(__name__)
+
+DISK_SUFFIX = ".img"
+
+
+class ImageCache:
+    """Encoded bytes of images, least recently used entries are evicted first"""
+
+    def __init__(self, max_bytes, path=None, max_disk_bytes=0):
+        self.max_bytes = max_bytes
+        self.path = path if max_disk_bytes else None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        # Disk entries in least recently used order, read from the directory on first use
+        self._disk_entries = None
+        self._disk_size = 0
+        # Encoding runs in executor threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(data, *params):
+        """Cache key of source bytes encoded with params"""
+        digest = hashlib.sha256(data)
+        digest.update(repr(params).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Cached value for key or None, blocking when it is read from disk"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            value = self._disk_get(key)
+            if value is not None:
+                self._memory_put(key, value)
+                self.hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Store a value, blocking when it is written to disk"""
+        with self._lock:
+            self._memory_put(key, value)
+            self._disk_put(key, value)
+
+    def get_or_encode(self, key, encode):
+        """Cached value for key, or the result of encode() which is then cached"""
+        value = self.get(key)
+        if value is None:
+            value = encode()
+            self.put(key, value)
+        return value
+
+    def _memory_put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _disk_index(self):
+        """Disk entries in least recently used order, scanning the directory once"""
+        if self._disk_entries is None:
+            self._disk_entries = OrderedDict()
+            os.makedirs(self.path, exist_ok=True)
+            files = [entry for entry in os.scandir(self.path)
+                     if entry.is_file() and entry.name.endswith(DISK_SUFFIX)]
+            for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+                size = entry.stat().st_size
+                self._disk_entries[entry.name[:-len(DISK_SUFFIX)]] = size
+                self._disk_size += size
+        return self._disk_entries
+
+    def _disk_file(self, key):
+        return os.path.join(self.path, key + DISK_SUFFIX)
+
+    def _disk_get(self, key):
+        if self.path is None or key not in self._disk_index():
+            return None
+        try:
+            with open(self._disk_file(key), "rb") as f:
+                value = f.read()
+        except OSError as e:
+            _LOGGER.warning(f"Couldn't read cached image {key}: {e}")
+            self._disk_size -= self._disk_entries.pop(key)
+            return None
+        self._disk_entries.move_to_end(key)
+        return value
+
+    def _disk_put(self, key, value):
+        if self.path is None or len(value) > self.max_disk_bytes or key in self._disk_index():
+            return
+        tmp_file = self._disk_file(key) + ".tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                f.write(value)
+            os.replace(tmp_file, self._disk_file(key))
+        except OSError as e:
+            _LOGGER.warning(f"Couldn't write cached image {key}: {e}")
+            return
+        self._disk_entries[key] = len(value)
+        self._disk_size += len(value)
+        while self._disk_size > self.max_disk_bytes:
+            evicted, size = self._disk_entries.popitem(last=False)
+            self._disk_size -= size
+            try:
+                os.remove(self._disk_file(evicted))
+            except OSError:
+                pass
+
+    def __str__(self):
+        return f"ImageCache({len(self._entries)} entries, {self._size} bytes, {self.hits} hits, {self.misses} misses)"
@@ -0,0 +1,184 @@
+# image_encoder.py
+import io
+import base64
+import logging
+
+from .providers import Request
+from .const import (
+    DOMAIN,
+    CONF_IMAGE_FORMAT,
+    CONF_IMAGE_QUALITY,
+    CONF_CHROMA_SUBSAMPLING,
+    CONF_OPTIMIZE_IMAGES,
+    CONF_MAX_IMAGE_BYTES,
+    IMAGE_FORMAT_JPEG,
+    IMAGE_FORMAT_WEBP,
+    DEFAULT_IMAGE_FORMAT,
+    DEFAULT_IMAGE_QUALITY,
+    DEFAULT_CHROMA_SUBSAMPLING,
+    DEFAULT_MAX_IMAGE_BYTES,
+    WEBP_PROVIDERS,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Lowest quality tried when searching for an encoding within max_bytes
+MIN_SEARCH_QUALITY = 30
+# Images still too large at the lowest quality are downscaled by this factor and searched again
+DOWNSCALE_FACTOR = 0.75
+MAX_DOWNSCALE_STEPS = 3
+
+MIME_TYPES = {
+    IMAGE_FORMAT_JPEG: "image/jpeg",
+    IMAGE_FORMAT_WEBP: "image/webp",
+}
+
+
+class EncodedImage:
+    """
+    Encoded bytes of an image sent to a provider.
+
+    Providers want the image as raw bytes, base64 or a base64 data URL. The text
+    forms are built on first use and kept, so each image is converted at most once
+    per request, and only into the form the provider uses.
+    """
+
+    __slots__ = ("mime_type", "_data", "_base64", "_data_url")
+
+    def __init__(self, data, mime_type="image/jpeg"):
+        self.mime_type = mime_type
+        self._data = data
+        self._base64 = None
+        self._data_url = None
+
+    @classmethod
+    def from_base64(cls, base64_image, mime_type="image/jpeg"):
+        """Image that is already base64 encoded, its bytes are decoded on first use"""
+        image = cls(None, mime_type)
+        image._base64 = base64_image
+        return image
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = base64.b64decode(self._base64)
+        return self._data
+
+    @property
+    def base64(self):
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._data).decode('ascii')
+        return self._base64
+
+    @property
+    def data_url(self):
+        if self._data_url is None:
+            # Encoded straight into the URL unless the bare base64 was needed too
+            encoded = self._base64 or base64.b64encode(self._data).decode('ascii')
+            self._data_url = f"data:{self.mime_type};base64,{encoded}"
+        return self._data_url
+
+    @property
+    def format(self):
+        """Format name of the mime type, e.g. jpeg"""
+        return self.mime_type.split("/")[1]
+
+
+class ImageEncoder:
+    """Output format and compression settings for images sent to a provider"""
+
+    def __init__(self, image_format=DEFAULT_IMAGE_FORMAT, quality=DEFAULT_IMAGE_QUALITY,
+                 subsampling=DEFAULT_CHROMA_SUBSAMPLING, optimize=False, max_bytes=DEFAULT_MAX_IMAGE_BYTES):
+        self.image_format = image_format if image_format in MIME_TYPES else DEFAULT_IMAGE_FORMAT
+        self.quality = max(1, min(100, int(quality)))
+        self.subsampling = subsampling
+        self.optimize = bool(optimize)
+        self.max_bytes = int(max_bytes or 0)
+
+    @classmethod
+    def from_call(cls, hass, call):
+        """Settings of the provider's config entry, overridden by the service call"""
+        entry_data = hass.data.get(DOMAIN, {}).get(call.provider) or {}
+
+        def option(call_value, conf_key, default):
+            if call_value is not None:
+                return call_value
+            return entry_data.get(conf_key, default)
+
+        image_format = option(call.image_format, CONF_IMAGE_FORMAT, DEFAULT_IMAGE_FORMAT)
+        provider = Request.get_provider(hass, call.provider) if entry_data else None
+        if image_format == IMAGE_FORMAT_WEBP and provider not in WEBP_PROVIDERS:
+            _LOGGER.warning(f"{provider} does not accept WebP images, using JPEG instead")
+            image_format = IMAGE_FORMAT_JPEG
+
+        return cls(
+            image_format=image_format,
+            quality=option(call.image_quality, CONF_IMAGE_QUALITY, DEFAULT_IMAGE_QUALITY),
+            subsampling=option(call.chroma_subsampling, CONF_CHROMA_SUBSAMPLING, DEFAULT_CHROMA_SUBSAMPLING),
+            optimize=option(call.optimize_images, CONF_OPTIMIZE_IMAGES, False),
+            max_bytes=option(call.max_image_bytes, CONF_MAX_IMAGE_BYTES, DEFAULT_MAX_IMAGE_BYTES),
+        )
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.image_format]
+
+    @property
+    def extension(self):
+        return "jpg" if self.image_format == IMAGE_FORMAT_JPEG else self.image_format
+
+    @property
+    def key(self):
+        """Hashable summary of the settings, used to cache encodings"""
+        return (self.image_format, self.quality, self.subsampling, self.optimize, self.max_bytes)
+
+    def accepts(self, data):
+        """Whether already encoded JPEG bytes can be sent as they are"""
+        return self.image_format == IMAGE_FORMAT_JPEG and (not self.max_bytes or len(data) <= self.max_bytes)
+
+    def _save(self, img, quality):
+        img_byte_arr = io.BytesIO()
+        if self.image_format == IMAGE_FORMAT_WEBP:
+            # method trades encoding time for size (0-6, Pillow defaults to 4)
+            img.save(img_byte_arr, format='WEBP', quality=quality,
+                     method=6 if self.optimize else 4)
+        else:
+            img.save(img_byte_arr, format='JPEG', quality=quality, subsampling=self.subsampling,
+                     optimize=self.optimize, progressive=self.optimize)
+        return img_byte_arr.getvalue()
+
+    def _search(self, img):
+        """Highest quality encoding of img within max_bytes, or the smallest one tried"""
+        low, high = min(MIN_SEARCH_QUALITY, self.quality), self.quality
+        best, smallest = None, None
+        while low <= high:
+            quality = (low + high) // 2
+            data = self._save(img, quality)
+            if len(data) <= self.max_bytes:
+                best = data
+                low = quality + 1
+            else:
+                smallest = data if smallest is None or len(data) < len(smallest) else smallest
+                high = quality - 1
+        return best, smallest
+
+    def encode(self, img):
+        """Encode an RGB or L image, searching quality and size to stay within max_bytes"""
+        data = self._save(img, self.quality)
+        if not self.max_bytes or len(data) <= self.max_bytes:
+            return data
+
+        for _ in range(MAX_DOWNSCALE_STEPS + 1):
+            best, smallest = self._search(img)
+            if best is not None:
+                return best
+            data = smallest
+            width, height = img.size
+            if min(width, height) * DOWNSCALE_FACTOR < 16:
+                break
+            img = img.resize((int(width * DOWNSCALE_FACTOR),
+                              int(height * DOWNSCALE_FACTOR)))
+
+        _LOGGER.warning(
+            f"Could not encode image within {self.max_bytes} bytes, sending {len(data)} bytes")
+        return data
@@ -2,42 +2,404 @@
 import base64
 import io
 import os
+import re
+import math
 import uuid
 import shutil
+import tempfile
 import logging
 import time
 import asyncio
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from functools import partial
-from bisect import insort
-from PIL import Image, UnidentifiedImageError
-import numpy as np
+from contextlib import asynccontextmanager, aclosing
+from collections import deque
+from PIL import Image, ImageSequence, UnidentifiedImageError
 from homeassistant.helpers.network import get_url
-from homeassistant.exceptions import ServiceValidationError
-
-from .const import DOMAIN
+from homeassistant.components import camera
+from homeassistant.exceptions import HomeAssistantError, ServiceValidationError
+
+from .frame_analysis import create_scorer, motion_crop, BackgroundModel, DiverseFrames, SCORING_WIDTH
+from .image_encoder import ImageEncoder, EncodedImage
+from .sizing import SizingPolicy
+from .capture import CaptureSchedule, LATENCY_SMOOTHING
+from .workers import media_workers
+from .const import (
+    DOMAIN,
+    DATA_VIDEO_SEMAPHORE,
+    DATA_CAPTURE_LATENCY,
+    DATA_CLIP_DOWNLOAD,
+    CONF_CLIP_DOWNLOAD_TIMEOUT,
+    CONF_MAX_CLIP_SIZE,
+    DEFAULT_CLIP_DOWNLOAD_TIMEOUT,
+    DEFAULT_MAX_CLIP_SIZE,
+    DATA_FRIGATE_LATENCY,
+    DATA_IMAGE_CACHE,
+    DATA_BACKGROUND_MODELS,
+    FRIGATE_SOURCE_AUTO,
+    FRIGATE_SOURCE_CLIP,
+    FRIGATE_SOURCE_PREVIEW,
+    FRIGATE_SOURCE_SNAPSHOT,
+    DEFAULT_FRIGATE_SOURCE,
+    DEFAULT_FRIGATE_LATENCY_BUDGET,
+    FRAME_EXTRACTION_PIPE,
+    FRAME_EXTRACTION_DISK,
+    FRAME_EXTRACTION_TWO_PASS,
+    DEFAULT_FRAME_EXTRACTION,
+    DEFAULT_MAX_CONCURRENT_VIDEOS,
+    FRAME_SELECTION_BACKGROUND,
+    DEFAULT_FRAME_SELECTION,
+    CAPTURE_MODE_STREAM,
+    DEFAULT_CAPTURE_MODE,
+    DEFAULT_SAMPLE_RATE,
+    MOTION_CROP_CROP,
+    MOTION_CROP_CONTEXT,
+    DEFAULT_MOTION_CROP,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+# Read size for frames streamed from ffmpeg
+JPEG_PIPE_CHUNK_SIZE = 256 * 1024
+# ffmpeg processes seeking to samples of one video at the same time
+SEEK_CONCURRENCY = 4
+# Duration and video size in ffmpeg's summary of an input, e.g. "Duration: 00:01:02.50"
+DURATION_PATTERN = re.compile(rb"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+VIDEO_SIZE_PATTERN = re.compile(rb"Video: .*?, (\d+)x(\d+)")
+# Credentials and query strings (which may hold tokens) of URLs, removed before logging
+URL_CREDENTIALS_PATTERN = re.compile(r"(?<=://)[^/\s]*@")
+URL_QUERY_PATTERN = re.compile(r"(://[^\s?]*)\?\S*")
+# Presentation time of a frame in the showinfo filter's log
+PTS_TIME_PATTERN = re.compile(rb"pts_time:\s*(-?[\d.]+)")
+# Read size for Frigate clips streamed to disk and ffmpeg
+CLIP_CHUNK_SIZE = 256 * 1024
+# Seconds to wait for a camera to return a snapshot
+SNAPSHOT_TIMEOUT = 10
+# Extra seconds a live stream may take to connect before its first frame
+STREAM_CONNECT_TIMEOUT = 10
+# Home Assistant's MJPEG stream of any camera, the path of entity_picture is /api/camera_proxy/
+CAMERA_PROXY_PATH = "/api/camera_proxy/"
+CAMERA_PROXY_STREAM_PATH = "/api/camera_proxy_stream/"
+# Seconds each Frigate source is expected to take until it has been measured
+FRIGATE_SOURCE_LATENCY = {
+    FRIGATE_SOURCE_SNAPSHOT: 0.5,
+    FRIGATE_SOURCE_PREVIEW: 1.5,
+    FRIGATE_SOURCE_CLIP: 5,
+}
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@asynccontextmanager
+async def _ffmpeg(*args, stdin=None):
+    """Run ffmpeg with piped output, it is killed if the caller stops reading early"""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", *args,
+        stdin=stdin,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        yield process
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+def _redact_urls(text):
+    """Text with the credentials and query strings of the URLs in it removed"""
+    return URL_QUERY_PATTERN.sub(r"\1", URL_CREDENTIALS_PATTERN.sub("", text))
+
+
+async def _wait_ffmpeg(process, source):
+    """Wait for ffmpeg to exit after its output ended and log its errors"""
+    stderr = await process.stderr.read()
+    await process.wait()
+    if process.returncode != 0:
+        # ffmpeg echoes its input, which may be a stream URL with credentials
+        _LOGGER.error(
+            f"ffmpeg exited with {process.returncode} for {_redact_urls(source)}: "
+            f"{_redact_urls(stderr.decode(errors='ignore').strip())}")
+
+
+async def _read_jpeg_pipe(stream, deadline=None):
+    """
+    Yield the JPEGs ffmpeg's mjpeg encoder writes to an image2pipe stream.
+    Reading stops at the end of the stream or once the loop time passes deadline.
+    """
+    loop = asyncio.get_running_loop()
+    buffer = bytearray()
+    search_from = 0
+    while True:
+        if deadline is None:
+            chunk = await stream.read(JPEG_PIPE_CHUNK_SIZE)
+        else:
+            try:
+                chunk = await asyncio.wait_for(stream.read(JPEG_PIPE_CHUNK_SIZE), max(0, deadline - loop.time()))
+            except TimeoutError:
+                return
+        if not chunk:
+            return
+        buffer += chunk
+        # ffmpeg's mjpeg encoder writes no embedded thumbnails and FF bytes in
+        # the entropy coded data are stuffed, so the first EOI marker ends the frame
+        while True:
+            end = buffer.find(b"\xff\xd9", search_from)
+            if end == -1:
+                search_from = max(0, len(buffer) - 1)
+                break
+            frame_data = bytes(buffer[:end + 2])
+            del buffer[:end + 2]
+            search_from = 0
+            yield frame_data
+
+
+async def _video_info(video_path):
+    """(duration in seconds, (width, height)) of a video from ffmpeg's input summary, None where unknown"""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-i", video_path,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    # Without an output ffmpeg only prints the summary and exits
+    _, stderr = await process.communicate()
+    duration = size = None
+    if match := DURATION_PATTERN.search(stderr):
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    if match := VIDEO_SIZE_PATTERN.search(stderr):
+        size = (int(match.group(1)), int(match.group(2)))
+    return duration, size
+
+
+async def _seek_frame(video_path, timestamp, width=None, codec="mjpeg"):
+    """Image of the frame at timestamp (JPEG by default), decoding only from the keyframe before it"""
+    async with _ffmpeg(
+        "-hide_banner",
+        "-loglevel", "error",
+        # Round down to the millisecond so the seek doesn't land on the next frame
+        "-ss", f"{math.floor(timestamp * 1000) / 1000:.3f}",
+        "-i", video_path,
+        "-an", "-sn", "-dn",
+        *(("-vf", f"scale={width}:-1") if width else ()),
+        "-frames:v", "1",
+        "-f", "image2pipe",
+        "-c:v", codec,
+        *(("-q:v", "2") if codec == "mjpeg" else ()),
+        "pipe:1"
+    ) as process:
+        frame_data, _ = await process.communicate()
+    return frame_data
+
+
+def _video_semaphore(hass):
+    """Semaphore shared by all calls that limits how many videos are processed in parallel"""
+    if DATA_VIDEO_SEMAPHORE not in hass.data:
+        hass.data[DATA_VIDEO_SEMAPHORE] = asyncio.Semaphore(
+            DEFAULT_MAX_CONCURRENT_VIDEOS)
+    return hass.data[DATA_VIDEO_SEMAPHORE]
+
+
+def _clip_download_limits(hass):
+    """Timeout in seconds and size cap in bytes of Frigate clip downloads"""
+    limits = hass.data.get(DATA_CLIP_DOWNLOAD, {})
+    timeout = limits.get(CONF_CLIP_DOWNLOAD_TIMEOUT, DEFAULT_CLIP_DOWNLOAD_TIMEOUT)
+    max_size = limits.get(CONF_MAX_CLIP_SIZE, DEFAULT_MAX_CLIP_SIZE)
+    return timeout, max_size * 1024 * 1024
+
+
+def _decode_preview(data, max_frames, frame_selection):
+    """
+    Score the frames of a Frigate preview GIF.
+
+    Returns:
+        list[tuple]: (frame_number, frame, score) of the max_frames selected frames
+    """
+    scorer = create_scorer(frame_selection)
+    best_frames = DiverseFrames(max_frames)
+    previous_frame = None
+    previous_number = 0
+    with Image.open(io.BytesIO(data)) as gif:
+        for frame_number, img in enumerate(ImageSequence.Iterator(gif), start=1):
+            img = img.convert('RGB')
+            keep, score = scorer.score(img)
+            if not keep:
+                continue
+            if score is not None:
+                previous_frame.motion_box = scorer.motion_box
+                best_frames.offer(score, previous_number, previous_frame)
+            previous_frame, previous_number = Frame(image=img), frame_number
+    frames = best_frames.frames()
+    if not frames and previous_frame is not None:
+        frames.append((previous_number, previous_frame, 0))
+    return frames
+
+
+class Frame:
+    """
+    A single image shared by every processing stage.
+
+    The source bytes are decoded at most once while the decoded image is held,
+    and encodings are computed lazily and cached per target width and encoder.
+    """
+
+    def __init__(self, data=None, image=None):
+        self.data = data
+        self._image = image
+        # Whether the held image is decoded at full size and in its own mode
+        self._full = image is not None
+        self._header = None
+        self._encoded = {}
+        # Region that changed between this frame and its neighbour, see frame_analysis.motion_box
+        self.motion_box = None
+
+    @property
+    def image(self):
+        """Decoded image at full size, decodes the source bytes on first access"""
+        return self.load()
+
+    def load(self, min_width=None, mode=None):
+        """
+        Decode the frame. JPEGs are decoded directly at a reduced size using
+        libjpeg's DCT scaling (1/2, 1/4 or 1/8) when the smallest such scale is
+        still at least min_width wide, optionally converting to mode while decoding.
+        """
+        if self._image is not None:
+            if self._full or (min_width is not None and self._image.width >= min_width
+                              and mode in (None, self._image.mode)):
+                return self._image
+            self._image.close()
+
+        img = Image.open(io.BytesIO(self.data))
+        full_size = img.size
+        if min_width is not None and img.format == 'JPEG' and img.width > min_width:
+            min_height = max(1, round(img.height * min_width / img.width))
+            img.draft(mode, (min_width, min_height))
+        img.load()
+        self._image = img
+        self._full = img.size == full_size and mode is None
+        return img
+
+    def header(self):
+        """(format, size, mode) of the source bytes, read without decoding the image"""
+        if self._header is None:
+            with Image.open(io.BytesIO(self.data)) as img:
+                self._header = (img.format, img.size, img.mode)
+        return self._header
+
+    @property
+    def size(self):
+        """Full (width, height) of the frame"""
+        if self.data is None or (self._image is not None and self._full):
+            return self._image.size
+        return self.header()[1]
+
+    def _can_passthrough(self, target_width, encoder):
+        """Whether the source bytes can be sent as they are"""
+        if self.data is None or not encoder.accepts(self.data):
+            return False
+        image_format, (width, _), mode = self.header()
+        return image_format == 'JPEG' and mode in ('RGB', 'L') and width <= target_width
+
+    def crop(self, box):
+        """New frame of the pixel box (left, upper, right, lower) of this frame"""
+        return Frame(image=self.image.crop(box))
+
+    def release(self):
+        """Drop the decoded image to save memory, the source bytes are kept"""
+        if self._image is not None and self.data is not None:
+            self._image.close()
+            self._image = None
+
+    def encode(self, target_width, encoder=None):
+        """Bytes of the frame downscaled to target_width, encoded by encoder (JPEG by default)"""
+        encoder = encoder or ImageEncoder()
+        key = (target_width, encoder.key)
+        if key in self._encoded:
+            return self._encoded[key]
+        if self._can_passthrough(target_width, encoder):
+            # Already a small enough JPEG, skip the codec and keep the original quality
+            self._encoded[key] = self.data
+        else:
+            img = self.load(min_width=target_width)
+            # Convert GIFs, palette images and transparency to a mode the encoders accept
+            if img.mode not in ('RGB', 'L') or img.format == 'GIF':
+                img = img.convert('RGB')
+            # calculate new height based on aspect ratio
+            width, height = img.size
+            aspect_ratio = width / height
+            target_height = max(1, round(target_width / aspect_ratio))
+
+            # Resize the image only if it's larger than the target size
+            if width > target_width or height > target_height:
+                img = img.resize((target_width, target_height))
+
+            self._encoded[key] = encoder.encode(img)
+        return self._encoded[key]
+
+
+class SnapshotSource:
+    """
+    Snapshots of an image or camera entity.
+
+    Cameras are read in process through the camera component instead of making an
+    HTTP request back into Home Assistant. Other entities, and cameras the camera
+    component can't read, are fetched over HTTP from their entity_picture.
+    """
+
+    def __init__(self, hass, image_entity, fetch):
+        self.hass = hass
+        self.image_entity = image_entity
+        self._fetch = fetch
+        self.in_process = image_entity.startswith("camera.")
+
+    def _entity_picture_url(self):
+        entity_state = self.hass.states.get(self.image_entity)
+        if not entity_state:
+            raise ServiceValidationError(
+                f"Entity {self.image_entity} does not exist")
+        entity_picture = entity_state.attributes.get('entity_picture')
+        if not entity_picture:
+            raise ServiceValidationError(
+                f"Entity {self.image_entity} does not have an entity_picture attribute")
+        return get_url(self.hass) + entity_picture
+
+    async def fetch(self):
+        """Image bytes of the current snapshot, None if it couldn't be fetched"""
+        if self.in_process:
+            try:
+                image = await camera.async_get_image(self.hass, self.image_entity, timeout=SNAPSHOT_TIMEOUT)
+                return image.content
+            except HomeAssistantError as e:
+                _LOGGER.warning(
+                    f"Couldn't get {self.image_entity} from the camera component, using HTTP instead: {e}")
+                self.in_process = False
+        return await self._fetch(self._entity_picture_url())
+
 
 class MediaProcessor:
-    def __init__(self, hass, client):
+    def __init__(self, hass, client, encoder=None, sizing=None, mosaic=None):
         self.hass = hass
         self.session = async_get_clientsession(self.hass)
         self.client = client
+        self.encoder = encoder or ImageEncoder()
+        self.sizing = sizing or SizingPolicy()
+        self.cache = hass.data.get(DATA_IMAGE_CACHE)
+        self.workers = media_workers(hass)
+        # With a mosaic, frames are collected as (label, frame, score, cached) and sent as one grid
+        self.mosaic = mosaic
+        self._tiles = []
         self.base64_images = []
         self.filenames = []
         self.ssim_scores = []  # Add SSIM scores tracking for better image selection
         self.path = self.hass.config.path(f"www/{DOMAIN}")
         self.key_frame = ""
-
-    async def _encode_image(self, img):
-        """Encode image as base64"""
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        base64_image = base64.b64encode(
-            img_byte_arr.getvalue()).decode('utf-8')
-        return base64_image
+        # False once a recording scored against camera backgrounds found nothing that departed from them
+        self.departed = True
 
     async def _save_clip(self, clip_data=None, clip_path=None, image_data=None, image_path=None):
         # Ensure dir exists
@@ -56,117 +418,73 @@ class MediaProcessor:
                     f.write(clip_data)
         await self.hass.loop.run_in_executor(None, _run_save_clips, clip_data, clip_path, image_data, image_path)
 
-    def _convert_to_rgb(self, img):
-        if img.mode == 'RGBA' or img.format == 'GIF':
-            img = img.convert('RGB')
-        return img
-
-    async def _expose_image(self, frame_name, image_data, uid, frame_path=None):
+    async def _expose_image(self, frame_name, image_data, uid, extension="jpg"):
         # ensure /www/llmvision dir exists
         await self.hass.loop.run_in_executor(None, partial(os.makedirs, self.hass.config.path(f"www/{DOMAIN}"), exist_ok=True))
         if self.key_frame == "":
             filename = self.hass.config.path(
-                f"www/{DOMAIN}/{uid}-{frame_name}.jpg")
+                f"www/{DOMAIN}/{uid}-{frame_name}.{extension}")
             self.key_frame = filename
-            if image_data is None and frame_path is not None:
-                # open image in hass.loop
-                with await self.hass.loop.run_in_executor(None, Image.open, frame_path) as image:
-                    await self.hass.loop.run_in_executor(None, image.load)
-                    image_data = await self._encode_image(image)
             await self._save_clip(image_data=image_data, image_path=filename)
 
-    def _similarity_score(self, previous_frame, current_frame_gray):
+    def _output_width(self, frame, target_width):
+        """Width the provider gets the frame in, at most target_width"""
+        return self.sizing.target_width(frame.size, target_width)
+
+    def _frame_bytes(self, frame, target_width, cached=False):
+        output_width = self._output_width(frame, target_width)
+        if not cached or self.cache is None or frame.data is None:
+            return frame.encode(output_width, self.encoder)
+        key = self.cache.key(frame.data, output_width, self.encoder.key)
+        return self.cache.get_or_encode(key, partial(frame.encode, output_width, self.encoder))
+
+    async def _encode_frame(self, frame, target_width, cached=False):
         """
-        SSIM by Z. Wang: https://ece.uwaterloo.ca/~z70wang/research/ssim/
-        Paper:  Z. Wang, A. C. Bovik, H. R. Sheikh and E. P. Simoncelli,
-        "Image quality assessment: From error visibility to structural similarity," IEEE Transactions on Image Processing, vol. 13, no. 4, pp. 600-612, Apr. 2004.
+        Resize and encode a frame in the media workers, returns an EncodedImage.
+        Frames likely to repeat (files, snapshots) are looked up in the image cache with cached.
         """
-        K1 = 0.005
-        K2 = 0.015
-        L = 255
-
-        C1 = (K1 * L) ** 2
-        C2 = (K2 * L) ** 2
-
-        previous_frame_np = np.array(previous_frame)
-        current_frame_np = np.array(current_frame_gray)
-
-        # Ensure both frames have same dimensions
-        if previous_frame_np.shape != current_frame_np.shape:
-            min_shape = np.minimum(
-                previous_frame_np.shape, current_frame_np.shape)
-            previous_frame_np = previous_frame_np[:min_shape[0], :min_shape[1]]
-            current_frame_np = current_frame_np[:min_shape[0], :min_shape[1]]
-
-        # Calculate mean (mu)
-        mu1 = np.mean(previous_frame_np, dtype=np.float64)
-        mu2 = np.mean(current_frame_np, dtype=np.float64)
-
-        # Calculate variance (sigma^2) and covariance (sigma12)
-        sigma1_sq = np.var(previous_frame_np, dtype=np.float64, mean=mu1)
-        sigma2_sq = np.var(current_frame_np, dtype=np.float64, mean=mu2)
-        sigma12 = np.cov(previous_frame_np.flatten(),
-                         current_frame_np.flatten(),
-                         dtype=np.float64)[0, 1]
-
-        # Calculate SSIM
-        ssim = ((2 * mu1 * mu2 + C1) * (2 * sigma12 + C2)) / \
-            ((mu1**2 + mu2**2 + C1) * (sigma1_sq + sigma2_sq + C2))
-
-        return ssim
-
-    async def resize_image(self, target_width, image_path=None, image_data=None, img=None):
-        """Resize image to target_width"""
-        if image_path:
-            # Open the image file
-            img = await self.hass.loop.run_in_executor(None, Image.open, image_path)
-            with img:
-                await self.hass.loop.run_in_executor(None, img.load)
-                # Check if the image is a GIF and convert if necessary
-                img = self._convert_to_rgb(img)
-                # calculate new height based on aspect ratio
-                width, height = img.size
-                aspect_ratio = width / height
-                target_height = int(target_width / aspect_ratio)
-
-                # Resize the image only if it's larger than the target size
-                if width > target_width or height > target_height:
-                    img = img.resize((target_width, target_height))
-
-                # Encode the image to base64
-                base64_image = await self._encode_image(img)
-
-        elif image_data:
-            # Convert the image to base64
-            img_byte_arr = io.BytesIO()
-            img_byte_arr.write(image_data)
-            img = await self.hass.loop.run_in_executor(None, Image.open, img_byte_arr)
-            with img:
-                await self.hass.loop.run_in_executor(None, img.load)
-                img = self._convert_to_rgb(img)
-                # calculate new height based on aspect ratio
-                width, height = img.size
-                aspect_ratio = width / height
-                target_height = int(target_width / aspect_ratio)
-
-                if width > target_width or height > target_height:
-                    img = img.resize((target_width, target_height))
-
-                base64_image = await self._encode_image(img)
-        elif img:
-            with img:
-                img = self._convert_to_rgb(img)
-                # calculate new height based on aspect ratio
-                width, height = img.size
-                aspect_ratio = width / height
-                target_height = int(target_width / aspect_ratio)
-
-                if width > target_width or height > target_height:
-                    img = img.resize((target_width, target_height))
-
-                base64_image = await self._encode_image(img)
-
-        return base64_image
+        data = await self.workers.run(self._frame_bytes, frame, target_width, cached)
+        return EncodedImage(data, self.encoder.mime_type)
+
+    async def _add_frame(self, frame, filename, ssim_score, target_width, cached=False):
+        """Encode a frame and add it to the client, or keep it for the mosaic"""
+        if self.mosaic is not None:
+            self._tiles.append((filename, frame, ssim_score, cached))
+            return
+        self.client.add_frame(
+            image=await self._encode_frame(frame, target_width, cached),
+            filename=filename,
+            ssim_score=ssim_score,  # Pass SSIM score for Moondream selection
+        )
+
+    def _compose(self, tiles, target_width):
+        canvas = self.mosaic.compose([(label, frame.image) for label, frame, _, _ in tiles], self.sizing, target_width)
+        for _, frame, _, _ in tiles:
+            frame.release()
+        return Frame(image=canvas)
+
+    async def _add_mosaic(self, target_width):
+        """Add the frames kept for the mosaic to the client as one grid image"""
+        tiles, self._tiles = self._tiles, []
+        if not tiles:
+            return
+        if len(tiles) == 1:
+            label, frame, ssim_score, cached = tiles[0]
+        else:
+            label = ", ".join(label for label, _, _, _ in tiles if label)
+            frame = await self.workers.run(self._compose, tiles, target_width)
+            ssim_score = min(ssim_score for _, _, ssim_score, _ in tiles)
+            cached = False
+        self.client.add_frame(
+            image=await self._encode_frame(frame, target_width, cached),
+            filename=label,
+            ssim_score=ssim_score,
+        )
+
+    async def _expose_frame(self, frame_name, frame, target_width, uid):
+        """Expose a frame as it is sent to the provider"""
+        image_data = await self.workers.run(self._frame_bytes, frame, target_width)
+        await self._expose_image(frame_name, image_data, uid, extension=self.encoder.extension)
 
     async def _fetch(self, url, max_retries=2, retry_delay=1):
         """Fetch image from url and return image data"""
@@ -190,85 +508,249 @@ class MediaProcessor:
                 await asyncio.sleep(retry_delay)
         _LOGGER.warning(f"Failed to fetch {url} after {max_retries} retries")
 
-    async def record(self, image_entities, duration, max_frames, target_width, include_filename, expose_images):
+    async def _request(self, url, max_retries=2, retry_delay=1):
+        """Request url until it returns 200 and return the response with its body unread"""
+        retries = 0
+        while retries < max_retries:
+            _LOGGER.info(
+                f"Fetching {url} (attempt {retries + 1}/{max_retries})")
+            try:
+                response = await self.session.get(url)
+                if response.status != 200:
+                    _LOGGER.warning(
+                        f"Couldn't fetch clip (status code: {response.status})")
+                    response.release()
+                    retries += 1
+                    await asyncio.sleep(retry_delay)
+                    continue
+                return response
+            except Exception as e:
+                _LOGGER.error(f"Fetch failed: {e}")
+                retries += 1
+                await asyncio.sleep(retry_delay)
+        _LOGGER.warning(f"Failed to fetch {url} after {max_retries} retries")
+
+    def _frigate_url(self, event_id, name):
+        """URL of an event's file through Home Assistant's Frigate proxy"""
+        return get_url(self.hass) + "/api/frigate/notifications/" + event_id + "/" + name
+
+    async def _download_clip(self, response, clip_path, max_bytes, sink=None):
+        """
+        Stream a clip response to clip_path in chunks, so memory use doesn't grow with the clip.
+        Chunks are also written to sink (ffmpeg's stdin) while it accepts them,
+        which lets decoding start before the download finishes.
+        """
+        size = 0
+        try:
+            if response.content_length and response.content_length > max_bytes:
+                raise ServiceValidationError(
+                    f"Clip {response.url} is larger than {max_bytes} bytes")
+            with await self.hass.loop.run_in_executor(None, open, clip_path, "wb") as file:
+                async for chunk in response.content.iter_chunked(CLIP_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ServiceValidationError(
+                            f"Clip {response.url} is larger than {max_bytes} bytes")
+                    await self.hass.loop.run_in_executor(None, file.write, chunk)
+                    if sink is not None and not sink.is_closing():
+                        try:
+                            sink.write(chunk)
+                            await sink.drain()
+                        except (BrokenPipeError, ConnectionResetError):
+                            # ffmpeg gave up on the stream, the file is still completed
+                            sink.close()
+        finally:
+            # End of input for ffmpeg, also when the download failed
+            if sink is not None:
+                sink.close()
+        _LOGGER.info(f"Saved clip to {clip_path} ({size} bytes, temporarily)")
+
+    async def _poll_snapshots(self, image_entity, duration, interval):
+        """Yield a snapshot of image_entity every interval seconds until duration seconds have passed"""
+        source = SnapshotSource(self.hass, image_entity, self._fetch)
+        loop = asyncio.get_running_loop()
+        # Fetch latencies are remembered across calls to prefetch from the first tick on
+        latencies = self.hass.data.setdefault(DATA_CAPTURE_LATENCY, {})
+        schedule = CaptureSchedule(
+            loop.time(), duration, interval, latencies.get(image_entity))
+
+        while (fetch_at := schedule.next_fetch(loop.time())) is not None:
+            await asyncio.sleep(max(0, fetch_at - loop.time()))
+            fetch_start_time = loop.time()
+            try:
+                frame_data = await asyncio.wait_for(source.fetch(), schedule.remaining(fetch_start_time))
+            except TimeoutError:
+                schedule.fetched(loop.time() - fetch_start_time, captured=False)
+                _LOGGER.warning(
+                    f"Snapshot of {image_entity} didn't arrive before the end of the recording")
+                break
+            fetch_duration = loop.time() - fetch_start_time
+            schedule.fetched(fetch_duration, captured=bool(frame_data))
+
+            # Skip frame if fetch failed
+            if not frame_data:
+                continue
+
+            _LOGGER.info(
+                f"Fetched {image_entity} in {fetch_duration:.2f} seconds")
+            yield frame_data
+
+        latencies[image_entity] = schedule.latency
+        _LOGGER.info(
+            f"Recorded {image_entity}: {schedule.captured} frames captured, {schedule.missed} ticks missed, "
+            f"latency {schedule.latency or 0:.2f} seconds")
+
+    async def _stream_url(self, image_entity):
+        """URL ffmpeg can read the live video of a camera from, None if there is none"""
+        if not image_entity.startswith("camera."):
+            return None
+        try:
+            stream_source = await camera.async_get_stream_source(self.hass, image_entity)
+        except HomeAssistantError as e:
+            _LOGGER.warning(f"Couldn't get stream source of {image_entity}: {e}")
+            stream_source = None
+        if stream_source:
+            return stream_source
+        # Cameras without a stream source are still served as MJPEG by Home Assistant
+        entity_state = self.hass.states.get(image_entity)
+        entity_picture = entity_state.attributes.get(
+            'entity_picture', "") if entity_state else ""
+        if entity_picture.startswith(CAMERA_PROXY_PATH):
+            return get_url(self.hass) + entity_picture.replace(CAMERA_PROXY_PATH, CAMERA_PROXY_STREAM_PATH, 1)
+        return None
+
+    async def _sample_stream(self, stream_url, duration, sample_rate):
+        """Yield JPEGs sampled at sample_rate frames per second from one connection to a live stream"""
+        input_args = []
+        if stream_url.startswith("rtsp"):
+            input_args += ["-rtsp_transport", "tcp"]
+        if CAMERA_PROXY_STREAM_PATH in stream_url:
+            # Frames of the MJPEG proxy carry no timestamps
+            input_args += ["-use_wallclock_as_timestamps", "1"]
+        deadline = asyncio.get_running_loop().time() + duration + STREAM_CONNECT_TIMEOUT
+
+        async with _ffmpeg(
+            "-hide_banner",
+            "-loglevel", "error",
+            *input_args,
+            "-i", stream_url,
+            "-t", str(duration),
+            "-an", "-sn", "-dn",
+            "-vf", f"fps={sample_rate}",
+            "-f", "image2pipe",
+            "-c:v", "mjpeg",
+            "-q:v", "2",
+            "pipe:1"
+        ) as process:
+            async for frame_data in _read_jpeg_pipe(process.stdout, deadline):
+                yield frame_data
+            if process.stdout.at_eof():
+                await _wait_ffmpeg(process, stream_url)
+
+    async def _camera_frames(self, image_entity, duration, interval, capture_mode, sample_rate):
+        """Yield frames of a camera for duration seconds, from its live stream or from snapshots"""
+        if capture_mode == CAPTURE_MODE_STREAM:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + duration
+            stream_url = await self._stream_url(image_entity)
+            if stream_url:
+                frame_count = 0
+                async with aclosing(self._sample_stream(stream_url, duration, sample_rate)) as stream_frames:
+                    async for frame_data in stream_frames:
+                        frame_count += 1
+                        yield frame_data
+                if frame_count:
+                    return
+            # Snapshots only get the time the stream attempt left of the recording
+            duration = deadline - loop.time()
+            if duration <= 0:
+                _LOGGER.warning(
+                    f"Couldn't read the stream of {image_entity} and no recording time is left for snapshots")
+                return
+            _LOGGER.warning(
+                f"Couldn't read the stream of {image_entity}, using snapshots for the remaining {duration:.1f} seconds")
+
+        async with aclosing(self._poll_snapshots(image_entity, duration, interval)) as snapshots:
+            async for frame_data in snapshots:
+                yield frame_data
+
+    async def record(self, image_entities, duration, max_frames, target_width, include_filename, expose_images, frame_selection=DEFAULT_FRAME_SELECTION, capture_mode=DEFAULT_CAPTURE_MODE, sample_rate=DEFAULT_SAMPLE_RATE, motion_crop=DEFAULT_MOTION_CROP):
         """Wrapper for client.add_frame with integrated recorder
 
         Args:
             image_entities (list[string]): List of camera entities to record
             duration (float): Duration in seconds to record
             target_width (int): Target width for the images in pixels
+            frame_selection (string): How frames are scored (ssim, phash or background)
+            capture_mode (string): Poll snapshots or sample the live stream
+            sample_rate (float): Frames per second sampled from live streams
+            motion_crop (string): Crop frames to the region that changed, optionally with a full view
         """
 
         interval = 1 if duration < 3 else 2 if duration < 10 else 4 if duration < 30 else 6 if duration < 60 else 10
-        camera_frames = {}
+        # Best frames across all cameras and the whole recording, losers are dropped as soon as they are beaten
+        best_frames = DiverseFrames(max_frames)
+        # Cameras whose frames were all duplicates fall back to their first snapshot
+        fallback_frames = []
+        # Worst score offered, fallbacks never beat frames that changed
+        worst_score = 1.0
+        # Backgrounds of the cameras, kept across calls
+        backgrounds = self.hass.data.setdefault(DATA_BACKGROUND_MODELS, {})
+        departed = False
 
         # Record on a separate thread for each camera
         async def record_camera(image_entity, camera_number):
-            start = time.time()
+            nonlocal departed, worst_score
             frame_counter = 0
-            frames = {}
-            previous_frame = None
-            iteration_time = 0
-
-            while time.time() - start < duration + iteration_time:
-                fetch_start_time = time.time()
-                base_url = get_url(self.hass)
-                frame_url = base_url + \
-                    self.hass.states.get(image_entity).attributes.get(
-                        'entity_picture')
-                frame_data = await self._fetch(frame_url)
-
-                # Skip frame if fetch failed
-                if not frame_data:
-                    continue
-
-                fetch_duration = time.time() - fetch_start_time
-                _LOGGER.info(
-                    f"Fetched {image_entity} in {fetch_duration:.2f} seconds")
-
-                preprocessing_start_time = time.time()
-
-                with await self.hass.loop.run_in_executor(None, Image.open, io.BytesIO(frame_data)) as img:
-                    current_frame_gray = np.array(img.convert('L'))
-
-                    if previous_frame is not None:
-                        score = self._similarity_score(
-                            previous_frame, current_frame_gray)
-
-                        # Encode the image back to bytes
-                        buffer = io.BytesIO()
-                        img.save(buffer, format="JPEG")
-                        frame_data = buffer.getvalue()
-
+            first_frame = None
+            background = None
+            if frame_selection == FRAME_SELECTION_BACKGROUND:
+                background = backgrounds.setdefault(image_entity, BackgroundModel())
+            scorer = create_scorer(frame_selection, background)
+            camera_frames = self._camera_frames(
+                image_entity, duration, interval, capture_mode, sample_rate)
+
+            async with aclosing(camera_frames) as frames:
+                async for frame_data in frames:
+                    preprocessing_start_time = time.time()
+
+                    frame = Frame(data=frame_data)
+                    try:
+                        keep, score = await self._score_frame(frame, scorer)
+                    except UnidentifiedImageError:
+                        _LOGGER.error(f"Cannot identify frame of {image_entity}")
+                        continue
+
+                    if score is None or scorer.motion_box is not None:
+                        departed = True
+
+                    if not keep:
+                        # Near-duplicate of a frame already seen
+                        _LOGGER.debug(
+                            f"Dropped duplicate frame of {image_entity}")
+                    elif score is not None:
                         # Use either entity name or assign number to each camera
                         frame_label = (image_entity.replace("camera.", "") + " frame " + str(frame_counter)
                                        if include_filename else "camera " + str(camera_number) + " frame " + str(frame_counter))
-                        frames.update(
-                            {frame_label: {"frame_data": frame_data, "ssim_score": score}})
+                        frame.motion_box = scorer.motion_box
+                        best_frames.offer(score, frame_label, frame)
+                        worst_score = max(worst_score, score)
 
                         frame_counter += 1
-                        previous_frame = current_frame_gray
                     else:
-                        # Initialize previous_frame with the first frame
-                        previous_frame = current_frame_gray
                         # First snapshot of the camera, always considered important.
                         score = -9999
+                        first_frame = frame
 
-                preprocessing_duration = time.time() - preprocessing_start_time
-                _LOGGER.info(
-                    f"Preprocessing took: {preprocessing_duration:.2f} seconds")
-
-                adjusted_interval = max(
-                    0, interval - fetch_duration - preprocessing_duration)
-
-                if iteration_time == 0:
-                    iteration_time = time.time() - start
+                    preprocessing_duration = time.time() - preprocessing_start_time
                     _LOGGER.info(
-                        f"First iteration took: {iteration_time:.2f} seconds, interval adjusted to: {adjusted_interval}")
-
-                await asyncio.sleep(adjusted_interval)
+                        f"Preprocessing took: {preprocessing_duration:.2f} seconds")
 
-            camera_frames.update({image_entity: frames})
+            # Fall back to the first snapshot if every other frame was a duplicate
+            if frame_counter == 0 and first_frame is not None:
+                frame_label = (image_entity.replace("camera.", "") + " frame 0"
+                               if include_filename else "camera " + str(camera_number) + " frame 0")
+                fallback_frames.append((frame_label, first_frame))
 
         _LOGGER.info(f"Recording {', '.join([entity.replace(
             'camera.', '') for entity in image_entities])} for {duration} seconds")
@@ -276,49 +758,43 @@ class MediaProcessor:
         # start threads for each camera
         await asyncio.gather(*(record_camera(image_entity, image_entities.index(image_entity)) for image_entity in image_entities))
 
-        # Extract frames and their SSIM scores
-        frames_with_scores = []
-        for frame in camera_frames:
-            for frame_name, frame_data in camera_frames[frame].items():
-                frames_with_scores.append(
-                    (frame_name, frame_data["frame_data"], frame_data["ssim_score"]))
+        for frame_label, first_frame in fallback_frames:
+            best_frames.offer(worst_score, frame_label, first_frame)
 
-        # Sort frames by SSIM score
-        frames_with_scores.sort(key=lambda x: x[2])
+        if frame_selection == FRAME_SELECTION_BACKGROUND:
+            self.departed = departed
+            if not departed:
+                _LOGGER.info(f"Nothing departed from the background of {', '.join(image_entities)}")
 
-        # Select frames with lowest ssim SIM scores
-        selected_frames = frames_with_scores[:max_frames]
-        # Sort selected frames back into their original chronological order
-        selected_frames.sort(key=lambda x: x[0])
+        # Selected frames in the order they were captured
+        selected_frames, context = await self._crop_to_motion(best_frames.frames(), motion_crop)
+
+        if context:
+            frame_name, frame, ssim_score = context
+            await self._add_frame(frame, frame_name + " full view", ssim_score, target_width)
+            if expose_images:
+                await self._expose_frame("0", frame, target_width, uid=str(uuid.uuid4())[:8])
+            frame.release()
 
         # Add selected frames to client
-        for frame_name, frame_data, ssim_score in selected_frames:
-            resized_image = await self.resize_image(target_width=target_width, image_data=frame_data)
+        for frame_name, frame, ssim_score in selected_frames:
+            await self._add_frame(frame, frame_name, ssim_score, target_width)
             if expose_images:
-                await self._expose_image(frame_name[-1], resized_image, uid=str(uuid.uuid4())[:8])
+                await self._expose_frame(frame_name[-1], frame, target_width, uid=str(uuid.uuid4())[:8])
+            frame.release()
 
-            self.client.add_frame(
-                base64_image=resized_image,
-                filename=frame_name,
-                ssim_score=ssim_score  # Pass SSIM score for Moondream selection
-            )
+        await self._add_mosaic(target_width)
 
     async def add_images(self, image_entities, image_paths, target_width, include_filename, expose_images):
         """Wrapper for client.add_frame for images"""
         if image_entities:
             for image_entity in image_entities:
                 try:
-                    base_url = get_url(self.hass)
                     entity_state = self.hass.states.get(image_entity)
                     if not entity_state:
                         raise ServiceValidationError(f"Entity {image_entity} does not exist")
-                    
-                    entity_picture = entity_state.attributes.get('entity_picture')
-                    if not entity_picture:
-                        raise ServiceValidationError(f"Entity {image_entity} does not have an entity_picture attribute")
-                    
-                    image_url = base_url + entity_picture
-                    image_data = await self._fetch(image_url)
+
+                    image_data = await SnapshotSource(self.hass, image_entity, self._fetch).fetch()
 
                     # Skip frame if fetch failed
                     if not image_data:
@@ -327,15 +803,12 @@ class MediaProcessor:
                                 f"Failed to fetch image from {image_entity}")
 
                     # If entity snapshot requested, use entity name as 'filename'
-                    resized_image = await self.resize_image(target_width=target_width, image_data=image_data)
-                    self.client.add_frame(
-                        base64_image=resized_image,
-                        filename=entity_state.attributes.get('friendly_name') if include_filename else "",
-                        ssim_score=0.0  # Default SSIM score for single images
-                    )
+                    frame = Frame(data=image_data)
+                    await self._add_frame(frame, entity_state.attributes.get('friendly_name') if include_filename else "",
+                                          0.0, target_width, cached=True)
 
                     if expose_images:
-                        await self._expose_image("0", resized_image, str(uuid.uuid4())[:8])
+                        await self._expose_frame("0", frame, target_width, str(uuid.uuid4())[:8])
 
                 except AttributeError as e:
                     raise ServiceValidationError(f"Entity {image_entity} does not exist")
@@ -346,172 +819,541 @@ class MediaProcessor:
             for image_path in image_paths:
                 try:
                     image_path = image_path.strip()
-                    if include_filename and os.path.exists(image_path):
-                        self.client.add_frame(
-                            base64_image=await self.resize_image(target_width=target_width, image_path=image_path),
-                            filename=image_path.split('/')[-1].split('.')[-2],
-                            ssim_score=0.0  # Default SSIM score for single images
-                        )
-                    elif os.path.exists(image_path):
-                        self.client.add_frame(
-                            base64_image=await self.resize_image(target_width=target_width, image_path=image_path),
-                            filename="",
-                            ssim_score=0.0  # Default SSIM score for single images
-                        )
                     if not os.path.exists(image_path):
                         raise ServiceValidationError(
                             f"File {image_path} does not exist")
+                    frame = Frame(data=await self.hass.loop.run_in_executor(None, _read_file, image_path))
+                    await self._add_frame(frame, image_path.split('/')[-1].split('.')[-2] if include_filename else "",
+                                          0.0, target_width, cached=True)
                     if expose_images:
-                        await self._expose_image("0", await self.resize_image(target_width=target_width, image_path=image_path), str(uuid.uuid4())[:8])
+                        await self._expose_frame("0", frame, target_width, str(uuid.uuid4())[:8])
                 except Exception as e:
                     raise ServiceValidationError(f"Error: {e}")
+        await self._add_mosaic(target_width)
         return self.client
 
-    async def add_videos(self, video_paths, event_ids, max_frames, target_width, include_filename, expose_images, frigate_retry_attempts, frigate_retry_seconds):
-        """Wrapper for client.add_frame for videos"""
-        tmp_clips_dir = self.hass.config.path(
-            f"custom_components/{DOMAIN}/tmp_clips")
-        tmp_frames_dir = self.hass.config.path(
-            f"custom_components/{DOMAIN}/tmp_frames")
-        processed_event_ids = []
+    @staticmethod
+    def _score(frame, scorer):
+        keep, score = scorer.score(frame.load(SCORING_WIDTH, 'L'))
+        # Only the source bytes are kept until the frame is selected
+        frame.release()
+        return keep, score
+
+    async def _score_frame(self, frame, scorer):
+        """Decode a frame and score it in the media workers, returns (keep, score)"""
+        return await self.workers.run(self._score, frame, scorer)
+
+    @staticmethod
+    def _motion_crop(frame):
+        box = motion_crop(frame.motion_box, frame.size) if frame.motion_box else None
+        if box is None:
+            return frame
+        cropped = frame.crop(box)
+        frame.release()
+        return cropped
+
+    async def _crop_to_motion(self, frames, mode):
+        """
+        Crop (label, frame, score) tuples to the region that changed around each frame.
 
-        if not video_paths:
-            video_paths = []
-        if event_ids:
-            for event_id in event_ids:
-                try:
-                    base_url = get_url(self.hass)
-                    frigate_url = base_url + "/api/frigate/notifications/" + event_id + "/clip.mp4"
+        Frames without a motion box, or whose motion covers most of the frame, are kept
+        whole. Returns the tuples, and with MOTION_CROP_CONTEXT the uncropped tuple with
+        the most change as a full view (None if no frame was cropped).
+        """
+        if mode not in (MOTION_CROP_CROP, MOTION_CROP_CONTEXT):
+            return frames, None
+        cropped_frames = [(label, await self.workers.run(self._motion_crop, frame), score)
+                          for label, frame, score in frames]
+        cropped = [original for original, (_, frame, _) in zip(frames, cropped_frames)
+                   if frame is not original[1]]
+        _LOGGER.debug(f"Cropped {len(cropped)} of {len(frames)} frames to motion")
+        if mode != MOTION_CROP_CONTEXT or not cropped:
+            return cropped_frames, None
+        return cropped_frames, min(cropped, key=lambda entry: entry[2])
+
+    async def _extract_keyframes_pipe(self, video_path, max_frames, frame_selection, feed=None, sample_rate=None):
+        """Extract keyframes by reading JPEGs from an ffmpeg pipe and score them as they arrive
+
+        If feed is given, the video is read from ffmpeg's stdin instead, and feed(stdin)
+        runs alongside the decoder to write it. With sample_rate, frames are sampled at
+        that many frames per second instead of taking the keyframes.
+
+        Returns:
+            list[tuple]: (frame_number, frame, ssim_score) of the max_frames selected frames
+        """
+        best_frames = DiverseFrames(max_frames)
+        scorer = create_scorer(frame_selection)
+        previous_frame = None
+        # Number of the last kept frame, duplicates in between are skipped
+        previous_number = 0
+        frame_number = 0
+        async with _ffmpeg(
+            "-hide_banner",
+            "-loglevel", "error",
+            "-hwaccel", "auto",
+            *(() if sample_rate else ("-skip_frame", "nokey")),
+            "-an", "-sn", "-dn",
+            "-i", "pipe:0" if feed else video_path,
+            *(("-vf", f"fps={sample_rate}") if sample_rate else ("-fps_mode", "passthrough")),
+            "-f", "image2pipe",
+            "-c:v", "mjpeg",
+            "-q:v", "2",
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE if feed else None,
+        ) as process:
+            feeder = asyncio.create_task(feed(process.stdin)) if feed else None
+            try:
+                async for frame_data in _read_jpeg_pipe(process.stdout):
+                    frame = Frame(data=frame_data)
+                    frame_number += 1
+                    try:
+                        keep, score = await self._score_frame(frame, scorer)
+                    except UnidentifiedImageError:
+                        _LOGGER.error(
+                            f"Cannot identify frame {frame_number} of {video_path}")
+                        continue
+                    if not keep:
+                        continue
+                    if score is not None:
+                        previous_frame.motion_box = scorer.motion_box
+                        best_frames.offer(score, previous_number, previous_frame)
+                    previous_frame, previous_number = frame, frame_number
+                await _wait_ffmpeg(process, video_path)
+                if feeder:
+                    # Raises if the download failed
+                    await feeder
+            finally:
+                if feeder and not feeder.done():
+                    feeder.cancel()
+                    await asyncio.gather(feeder, return_exceptions=True)
+
+        frames = best_frames.frames()
+        if len(frames) == 0 and previous_frame is not None:
+            frames.append((previous_number, previous_frame, 0))
+        return frames
+
+    async def _extract_keyframes_disk(self, video_path, max_frames, frame_selection, tmp_frames_dir):
+        """Extract keyframes to tmp_frames_dir with ffmpeg and score them from disk
+
+        Returns:
+            list[tuple]: (frame_number, frame, ssim_score) of the max_frames selected frames
+        """
+        # create tmp dir to store extracted frames
+        await self.hass.loop.run_in_executor(None, partial(os.makedirs, tmp_frames_dir, exist_ok=True))
+        if os.path.exists(tmp_frames_dir):
+            _LOGGER.debug(f"Created {tmp_frames_dir}")
+        else:
+            _LOGGER.error(
+                f"Failed to create temp directory {tmp_frames_dir}")
+
+        # Extract iframes from video
+        # use %05d formatting to enable iteration in sorted order
+        ffmpeg_cmd = [
+            "ffmpeg",
+            "-hide_banner",
+            "-hwaccel", "auto",
+            "-skip_frame", "nokey",
+            "-an", "-sn", "-dn",
+            "-i", f"'{video_path}'",
+            "-fps_mode", "passthrough",
+            os.path.join(tmp_frames_dir, "frame%05d.jpg")
+        ]
+        # Run ffmpeg command
+        await self.hass.loop.run_in_executor(None, os.system, " ".join(ffmpeg_cmd))
+
+        previous_frame_path = None
+        best_frames = DiverseFrames(max_frames)
+        scorer = create_scorer(frame_selection)
+
+        # Iterate over frames in sorted order
+        for frame_file in sorted(await self.hass.loop.run_in_executor(None, os.listdir, tmp_frames_dir)):
+            _LOGGER.debug(f"Adding frame {frame_file}")
+            frame_path = os.path.join(tmp_frames_dir, frame_file)
+            try:
+                frame = Frame(data=await self.hass.loop.run_in_executor(None, _read_file, frame_path))
+                keep, score = await self._score_frame(frame, scorer)
+                if not keep:
+                    continue
+                if score is not None:
+                    best_frames.offer(score, previous_frame_path, scorer.motion_box)
+                previous_frame_path = frame_path
+            except UnidentifiedImageError:
+                _LOGGER.error(
+                    f"Cannot identify image file {frame_path}")
+                continue
+
+        frames = best_frames.frames()
+        if len(frames) == 0 and previous_frame_path is not None:
+            frames.append((previous_frame_path, None, 0))
+
+        selected_frames = []
+        for frame_path, box, score in frames:
+            frame_number = int(os.path.splitext(os.path.basename(frame_path))[
+                0].replace("frame", ""))
+            frame = Frame(data=await self.hass.loop.run_in_executor(None, _read_file, frame_path))
+            frame.motion_box = box
+            selected_frames.append((frame_number, frame, score))
+        return selected_frames
+
+    @asynccontextmanager
+    async def _workspace(self):
+        """Scratch directory private to this call, removed when the call is done"""
+        tmp_dir = self.hass.config.path(f"custom_components/{DOMAIN}/tmp")
+        await self.hass.loop.run_in_executor(None, partial(os.makedirs, tmp_dir, exist_ok=True))
+        workspace = await self.hass.loop.run_in_executor(None, partial(tempfile.mkdtemp, dir=tmp_dir))
+        _LOGGER.debug(f"Created workspace {workspace}")
+        try:
+            yield workspace
+        finally:
+            await self.hass.loop.run_in_executor(None, partial(shutil.rmtree, workspace, ignore_errors=True))
+            _LOGGER.debug(f"Deleted workspace {workspace}")
 
-                    clip_data = await self._fetch(frigate_url, max_retries=frigate_retry_attempts, retry_delay=frigate_retry_seconds)
+    async def _extract_samples(self, video_path, timestamps, max_frames, frame_selection):
+        """Seek to each timestamp and score the frames found there
 
-                    if not clip_data:
-                        raise ServiceValidationError(
-                            f"Failed to fetch frigate clip {event_id}")
-
-                    # create tmp dir to store video clips
-                    await self.hass.loop.run_in_executor(None, partial(os.makedirs, tmp_clips_dir, exist_ok=True))
-                    # save clip to file with event_id as filename
-                    clip_path = os.path.join(
-                        tmp_clips_dir, event_id + ".mp4")
-                    await self._save_clip(clip_data, clip_path)
-                    _LOGGER.info(
-                        f"Saved frigate clip to {clip_path} (temporarily)")
-                    # append to video_paths
-                    video_paths.append(clip_path)
-                    processed_event_ids.append(event_id)
+        Returns:
+            list[tuple]: (sample_number, frame, score) of the max_frames selected frames
+        """
+        scorer = create_scorer(frame_selection)
+        best_frames = DiverseFrames(max_frames)
+        previous_frame = None
+        previous_number = 0
+        # Seek in small batches, so only a few frames are held before they are scored
+        for start in range(0, len(timestamps), SEEK_CONCURRENCY):
+            batch = timestamps[start:start + SEEK_CONCURRENCY]
+            batch_data = await asyncio.gather(*(_seek_frame(video_path, timestamp) for timestamp in batch))
+            for sample_number, timestamp, frame_data in zip(range(start + 1, start + len(batch) + 1), batch, batch_data):
+                if not frame_data:
+                    _LOGGER.debug(f"No frame at {timestamp:.3f}s of {video_path}")
+                    continue
+                frame = Frame(data=frame_data)
+                try:
+                    keep, score = await self._score_frame(frame, scorer)
+                except UnidentifiedImageError:
+                    _LOGGER.error(
+                        f"Cannot identify frame at {timestamp:.3f}s of {video_path}")
+                    continue
+                if not keep:
+                    continue
+                if score is not None:
+                    previous_frame.motion_box = scorer.motion_box
+                    best_frames.offer(score, previous_number, previous_frame)
+                previous_frame, previous_number = frame, sample_number
+
+        frames = best_frames.frames()
+        if not frames and previous_frame is not None:
+            frames.append((previous_number, previous_frame, 0))
+        return frames
+
+    async def _extract_keyframes_two_pass(self, video_path, max_frames, frame_selection, target_width=None, sample_rate=None):
+        """Score tiny grayscale frames in a first pass, then extract only the selected ones
+
+        The first pass has ffmpeg scale the keyframes (or frames sampled at sample_rate)
+        to SCORING_WIDTH and write them as raw 8-bit grayscale, so candidates are scored
+        without being encoded or decoded as JPEGs. Their times are read from the showinfo
+        filter's log. The second pass seeks to each selected frame and encodes it at the
+        width it is sent at.
+
+        Returns:
+            list[tuple]: (frame_number, frame, ssim_score) of the max_frames selected frames
+        """
+        _, size = await _video_info(video_path)
+        if size is None:
+            _LOGGER.warning(
+                f"Size of {video_path} is unknown, extracting keyframes in one pass")
+            return await self._extract_keyframes_pipe(video_path, max_frames, frame_selection, sample_rate=sample_rate)
+        width, height = size
+        scoring_width = min(SCORING_WIDTH, width)
+        scoring_height = max(1, round(height * scoring_width / width))
+        frame_bytes = scoring_width * scoring_height
+
+        scorer = create_scorer(frame_selection)
+        best_frames = DiverseFrames(max_frames)
+        frame_times = []
+        previous_number = None
+        frame_number = 0
+        async with _ffmpeg(
+            "-hide_banner",
+            "-nostats",
+            "-loglevel", "info",
+            "-hwaccel", "auto",
+            *(() if sample_rate else ("-skip_frame", "nokey")),
+            "-an", "-sn", "-dn",
+            "-i", video_path,
+            "-vf", ",".join((*((f"fps={sample_rate}",) if sample_rate else ()),
+                             "showinfo", f"scale={scoring_width}:{scoring_height}", "format=gray")),
+            *(() if sample_rate else ("-fps_mode", "passthrough")),
+            "-f", "rawvideo",
+            "pipe:1"
+        ) as process:
+            # Last lines of the log other than frame info, to report errors
+            log_tail = deque(maxlen=5)
+
+            async def read_log():
+                # Read concurrently, ffmpeg stalls once the stderr pipe is full
+                async for line in process.stderr:
+                    if match := PTS_TIME_PATTERN.search(line):
+                        frame_times.append(float(match.group(1)))
+                    else:
+                        log_tail.append(line.decode(errors='ignore').strip())
+            log_reader = asyncio.create_task(read_log())
+            try:
+                while True:
+                    try:
+                        raw_frame = await process.stdout.readexactly(frame_bytes)
+                    except asyncio.IncompleteReadError:
+                        break
+                    img = Image.frombuffer('L', (scoring_width, scoring_height), raw_frame, 'raw', 'L', 0, 1)
+                    keep, score = await self.workers.run(scorer.score, img)
+                    frame_number += 1
+                    if not keep:
+                        continue
+                    if score is not None:
+                        # Frames are extracted later, only their motion box is kept
+                        best_frames.offer(score, previous_number, scorer.motion_box)
+                    previous_number = frame_number
+                await log_reader
+                await process.wait()
+            finally:
+                if not log_reader.done():
+                    log_reader.cancel()
+            if process.returncode != 0:
+                _LOGGER.error(
+                    f"ffmpeg exited with {process.returncode} for {video_path}: {' '.join(log_tail)}")
+
+        selected = best_frames.frames()
+        if not selected and previous_number is not None:
+            selected.append((previous_number, None, 0))
+        if len(frame_times) < frame_number:
+            _LOGGER.error(f"Missing frame times for {video_path}, extracting keyframes in one pass")
+            return await self._extract_keyframes_pipe(video_path, max_frames, frame_selection, sample_rate=sample_rate)
+
+        # Second pass: decode only the selected frames, at the width they are sent at.
+        # PNG is lossless, so they are compressed only once, by the encoder
+        output_width = self.sizing.target_width(size, target_width or width)
+        frames = []
+        for start in range(0, len(selected), SEEK_CONCURRENCY):
+            batch = selected[start:start + SEEK_CONCURRENCY]
+            batch_data = await asyncio.gather(*(_seek_frame(video_path, frame_times[number - 1], output_width, "png")
+                                                for number, _, _ in batch))
+            for (number, box, score), frame_data in zip(batch, batch_data):
+                if frame_data:
+                    frame = Frame(data=frame_data)
+                    frame.motion_box = box
+                    frames.append((number, frame, score))
+                else:
+                    _LOGGER.error(
+                        f"Cannot extract frame at {frame_times[number - 1]:.3f}s of {video_path}")
+        return frames
+
+    async def _extract_keyframes(self, video_path, max_frames, frame_extraction, frame_selection, workspace, sampling=None, target_width=None):
+        """Extract and score the keyframes, or the frames picked by sampling, of a video file"""
+        _LOGGER.debug(f"Processing video: {video_path}")
+        if sampling and not sampling.keyframes:
+            duration, _ = await _video_info(video_path)
+            sample_rate = sampling.pass_rate(duration)
+            if sample_rate and frame_extraction == FRAME_EXTRACTION_TWO_PASS:
+                return await self._extract_keyframes_two_pass(video_path, max_frames, frame_selection, target_width, sample_rate)
+            if sample_rate:
+                return await self._extract_keyframes_pipe(video_path, max_frames, frame_selection, sample_rate=sample_rate)
+            timestamps = sampling.timestamps(duration)
+            if timestamps is not None:
+                return await self._extract_samples(video_path, timestamps, max_frames, frame_selection)
+            _LOGGER.warning(
+                f"Duration of {video_path} is unknown, extracting keyframes instead of sampling by {sampling.mode}")
+        if frame_extraction == FRAME_EXTRACTION_DISK:
+            frames_dir = await self.hass.loop.run_in_executor(None, partial(tempfile.mkdtemp, prefix="frames", dir=workspace))
+            return await self._extract_keyframes_disk(video_path, max_frames, frame_selection, frames_dir)
+        if frame_extraction == FRAME_EXTRACTION_TWO_PASS:
+            return await self._extract_keyframes_two_pass(video_path, max_frames, frame_selection, target_width)
+        return await self._extract_keyframes_pipe(video_path, max_frames, frame_selection)
+
+    async def _process_video(self, video_path, max_frames, frame_extraction, frame_selection, workspace, sampling=None, target_width=None):
+        """Extract and score the keyframes of a single video"""
+        if not os.path.exists(video_path):
+            raise ServiceValidationError(
+                f"File {video_path} does not exist")
+        # Limit how many videos are decoded at once across all calls
+        async with _video_semaphore(self.hass):
+            return await self._extract_keyframes(video_path, max_frames, frame_extraction, frame_selection, workspace, sampling, target_width)
+
+    async def _process_clip(self, event_id, clip_path, max_frames, frame_extraction, frame_selection, workspace, frigate_retry_attempts, frigate_retry_seconds, sampling=None, target_width=None):
+        """
+        Download a Frigate clip to clip_path and extract its keyframes.
 
-                except AttributeError as e:
+        With pipe extraction of keyframes the clip is decoded while it downloads. Clips ffmpeg can't
+        read from a stream (index at the end of the file) are decoded again from disk.
+        """
+        frigate_url = self._frigate_url(event_id, "clip.mp4")
+        timeout, max_bytes = _clip_download_limits(self.hass)
+        async with _video_semaphore(self.hass):
+            response = await self._request(frigate_url, max_retries=frigate_retry_attempts, retry_delay=frigate_retry_seconds)
+            if response is None:
+                raise ServiceValidationError(
+                    f"Failed to fetch frigate clip {event_id}")
+
+            async def download(sink=None):
+                try:
+                    async with asyncio.timeout(timeout):
+                        await self._download_clip(response, clip_path, max_bytes, sink)
+                except TimeoutError:
                     raise ServiceValidationError(
-                        f"Failed to fetch frigate clip {event_id}: {e}")
+                        f"Downloading frigate clip {event_id} took longer than {timeout}s")
 
-        _LOGGER.debug(f"Processing videos: {video_paths}")
-        for video_path in video_paths:
             try:
-                current_event_id = str(uuid.uuid4())
-                processed_event_ids.append(current_event_id)
-                video_path = video_path.strip()
-                if os.path.exists(video_path):
-                    # create tmp dir to store extracted frames
-                    await self.hass.loop.run_in_executor(None, partial(os.makedirs, tmp_frames_dir, exist_ok=True))
-                    if os.path.exists(tmp_frames_dir):
-                        _LOGGER.debug(f"Created {tmp_frames_dir}")
-                    else:
-                        _LOGGER.error(
-                            f"Failed to create temp directory {tmp_frames_dir}")
-
-                    # Extract iframes from video
-                    # use %05d formatting to enable iteration in sorted order
-                    ffmpeg_cmd = [
-                        "ffmpeg",
-                        "-hide_banner",
-                        "-hwaccel", "auto",
-                        "-skip_frame", "nokey",
-                        "-an", "-sn", "-dn",
-                        "-i", f"'{video_path}'",
-                        "-fps_mode", "passthrough",
-                        os.path.join(tmp_frames_dir, "frame%05d.jpg")
-                    ]
-                    # Run ffmpeg command
-                    await self.hass.loop.run_in_executor(None, os.system, " ".join(ffmpeg_cmd))
-
-                    previous_frame, previous_frame_path = None, None
-                    frames = []
-
-                    # Iterate over frames in sorted order
-                    for frame_file in sorted(await self.hass.loop.run_in_executor(None, os.listdir, tmp_frames_dir)):
-                        _LOGGER.debug(f"Adding frame {frame_file}")
-                        frame_path = os.path.join(
-                            tmp_frames_dir, frame_file)
-                        try:
-                            # open image in hass.loop
-                            with await self.hass.loop.run_in_executor(None, Image.open, frame_path) as img:
-                                await self.hass.loop.run_in_executor(None, img.load)
-                                # Remove transparency for compatibility
-                                if img.mode == 'RGBA':
-                                    img = img.convert('RGB')
-                                    await self.hass.loop.run_in_executor(None, img.save, frame_path)
-
-                                current_frame_gray = np.array(img.convert('L'))
-
-                            # Calculate similarity score
-                            if previous_frame is not None:
-                                score = self._similarity_score(
-                                    previous_frame, current_frame_gray)
-                                # Insert the new frame, maintain sorted order
-                                insort(frames, (previous_frame_path,
-                                       score), key=lambda x: x[1])
-                                if len(frames) > max_frames:
-                                    # Keep only max_frames many frames with lowest SSIM scores
-                                    frames.pop()
-                            previous_frame = current_frame_gray
-                            previous_frame_path = frame_path
-                        except UnidentifiedImageError:
-                            _LOGGER.error(
-                                f"Cannot identify image file {frame_path}")
-                            continue
-
-                    if len(frames) == 0 and previous_frame_path is not None:
-                        frames.append((previous_frame_path, 0))
+                if frame_extraction != FRAME_EXTRACTION_PIPE or (sampling and not sampling.keyframes):
+                    # Seeking and the duration need the complete file
+                    await download()
+                    return await self._extract_keyframes(clip_path, max_frames, frame_extraction, frame_selection, workspace, sampling, target_width)
+                frames = await self._extract_keyframes_pipe(clip_path, max_frames, frame_selection, feed=download)
+            finally:
+                response.release()
+            if not frames:
+                _LOGGER.info(
+                    f"Couldn't decode frigate clip {event_id} while downloading, decoding {clip_path}")
+                frames = await self._extract_keyframes_pipe(clip_path, max_frames, frame_selection)
+            return frames
+
+    async def _frigate_snapshot(self, event_id, frigate_retry_attempts, frigate_retry_seconds):
+        """Frigate's snapshot of an event, or its thumbnail for events saved without one"""
+        image_data = await self._fetch(self._frigate_url(event_id, "snapshot.jpg"),
+                                       max_retries=frigate_retry_attempts, retry_delay=frigate_retry_seconds)
+        if not image_data:
+            image_data = await self._fetch(self._frigate_url(event_id, "thumbnail.jpg"), max_retries=1)
+        if not image_data:
+            return []
+        return [(0, Frame(data=image_data), 0)]
+
+    async def _frigate_preview(self, event_id, max_frames, frame_selection, frigate_retry_attempts, frigate_retry_seconds):
+        """Best frames of the low resolution preview of an event"""
+        preview_data = await self._fetch(self._frigate_url(event_id, "event_preview.gif"),
+                                         max_retries=frigate_retry_attempts, retry_delay=frigate_retry_seconds)
+        if not preview_data:
+            return []
+        try:
+            return await self.workers.run(_decode_preview, preview_data, max_frames, frame_selection)
+        except (UnidentifiedImageError, OSError) as e:
+            _LOGGER.error(f"Cannot decode preview of frigate event {event_id}: {e}")
+            return []
+
+    def _expected_latency(self, source):
+        """Seconds a Frigate source is expected to take, averaged over earlier calls"""
+        return self.hass.data.get(DATA_FRIGATE_LATENCY, {}).get(source, FRIGATE_SOURCE_LATENCY[source])
+
+    def _record_latency(self, source, latency):
+        latencies = self.hass.data.setdefault(DATA_FRIGATE_LATENCY, {})
+        if source in latencies:
+            latencies[source] += LATENCY_SMOOTHING * (latency - latencies[source])
+        else:
+            latencies[source] = latency
+
+    async def _process_event(self, event_id, clip_path, max_frames, frame_extraction, frame_selection, workspace, frigate_retry_attempts, frigate_retry_seconds, frigate_source, frigate_latency_budget, sampling=None, target_width=None):
+        """
+        Frames of a Frigate event from the source chosen by frigate_source.
 
-                    if expose_images:
-                        # Expose images with original size, keep SSIM score order
-                        for (frame_path, _) in frames:
-                            frame_name = os.path.splitext(os.path.basename(frame_path))[
-                                0].replace("frame", "")
-                            await self._expose_image(frame_name, None, current_event_id[:8], frame_path)
-
-                    # Add frames to client, sorted by frame number instead of SSIM score
-                    for counter, (frame_path, ssim_score) in enumerate(sorted(frames, key=lambda x: x[0]), start=1):
-                        resized_image = await self.resize_image(image_path=frame_path, target_width=target_width)
-                        self.client.add_frame(
-                            base64_image=resized_image,
-                            filename=f"{os.path.splitext(os.path.basename(video_path))[0]} (frame {counter})" if include_filename else f"Video frame {counter}",
-                            ssim_score=ssim_score  # Pass SSIM score for Moondream selection
-                        )
+        In auto mode the event's snapshot is fetched first. The preview and then the
+        clip are only fetched while more frames are needed and the source is expected
+        to finish within frigate_latency_budget seconds (0 for no limit).
+        """
+        loop = self.hass.loop
+        start = loop.time()
+
+        async def timed(source, fetch):
+            source_start = loop.time()
+            frames = await fetch
+            if frames:
+                self._record_latency(source, loop.time() - source_start)
+            return frames
+
+        def affordable(source):
+            if not frigate_latency_budget:
+                return True
+            return loop.time() - start + self._expected_latency(source) <= frigate_latency_budget
+
+        def clip():
+            return timed(FRIGATE_SOURCE_CLIP, self._process_clip(event_id, clip_path, max_frames, frame_extraction, frame_selection,
+                                                                 workspace, frigate_retry_attempts, frigate_retry_seconds, sampling, target_width))
+
+        if frigate_source not in (FRIGATE_SOURCE_AUTO, FRIGATE_SOURCE_PREVIEW, FRIGATE_SOURCE_SNAPSHOT):
+            return await clip()
+
+        frames = []
+        if frigate_source != FRIGATE_SOURCE_PREVIEW:
+            frames = await timed(FRIGATE_SOURCE_SNAPSHOT, self._frigate_snapshot(
+                event_id, frigate_retry_attempts, frigate_retry_seconds))
+        if frigate_source == FRIGATE_SOURCE_PREVIEW or (
+                frigate_source == FRIGATE_SOURCE_AUTO and len(frames) < max_frames and affordable(FRIGATE_SOURCE_PREVIEW)):
+            frames += await timed(FRIGATE_SOURCE_PREVIEW, self._frigate_preview(
+                event_id, max_frames - len(frames), frame_selection, frigate_retry_attempts, frigate_retry_seconds))
+        if frigate_source == FRIGATE_SOURCE_AUTO and len(frames) < max_frames and affordable(FRIGATE_SOURCE_CLIP):
+            try:
+                # Clip keyframes are full resolution, so they replace the other frames
+                frames = await clip()
+            except ServiceValidationError as e:
+                if not frames:
+                    raise
+                _LOGGER.warning(f"Using {len(frames)} frames of frigate event {event_id}: {e}")
+
+        if not frames:
+            raise ServiceValidationError(
+                f"Failed to fetch {frigate_source} of frigate event {event_id}")
+        _LOGGER.info(f"Using {len(frames)} frames of frigate event {event_id} ({frigate_source})")
+        return frames
+
+    async def add_videos(self, video_paths, event_ids, max_frames, target_width, include_filename, expose_images, frigate_retry_attempts, frigate_retry_seconds, frame_extraction=DEFAULT_FRAME_EXTRACTION, frame_selection=DEFAULT_FRAME_SELECTION, frigate_source=DEFAULT_FRIGATE_SOURCE, frigate_latency_budget=DEFAULT_FRIGATE_LATENCY_BUDGET, sampling=None, motion_crop=DEFAULT_MOTION_CROP):
+        """Wrapper for client.add_frame for videos"""
+        if not video_paths:
+            video_paths = []
+        video_paths = [video_path.strip() for video_path in video_paths]
 
-                else:
-                    raise ServiceValidationError(
-                        f"File {video_path} does not exist")
-            except Exception as e:
-                raise ServiceValidationError(f"Error: {e}")
+        # Frames that are cropped to motion are extracted at full resolution
+        extraction_width = None if motion_crop in (MOTION_CROP_CROP, MOTION_CROP_CONTEXT) else target_width
 
-        # Clean up tmp dirs
-        try:
-            await self.hass.loop.run_in_executor(None, shutil.rmtree, tmp_clips_dir)
-            _LOGGER.info(
-                f"Deleted tmp folder: {tmp_clips_dir}")
-        except FileNotFoundError as e:
-            _LOGGER.info(f"Failed to delete tmp folder: {e}")
-        try:
-            await self.hass.loop.run_in_executor(None, shutil.rmtree, tmp_frames_dir)
-            _LOGGER.info(
-                f"Deleted tmp folder: {tmp_frames_dir}")
-        except FileNotFoundError as e:
-            _LOGGER.info(f"Failed to delete tmp folders: {e}")
+        async with self._workspace() as workspace:
+            # A failing video cancels the others before the workspace is removed
+            try:
+                async with asyncio.TaskGroup() as group:
+                    tasks = [group.create_task(self._process_video(video_path, max_frames, frame_extraction, frame_selection, workspace, sampling, extraction_width))
+                             for video_path in video_paths]
+                    # Frigate clips are streamed into the workspace with event_id as filename
+                    for event_id in event_ids or []:
+                        clip_path = os.path.join(workspace, event_id + ".mp4")
+                        video_paths.append(clip_path)
+                        tasks.append(group.create_task(self._process_event(
+                            event_id, clip_path, max_frames, frame_extraction, frame_selection, workspace,
+                            frigate_retry_attempts, frigate_retry_seconds, frigate_source, frigate_latency_budget, sampling, extraction_width)))
+            except ExceptionGroup as group_error:
+                # Report the first failure like a single video would
+                e = group_error
+                while isinstance(e, BaseExceptionGroup):
+                    e = e.exceptions[0]
+                raise ServiceValidationError(f"Error: {e}") from e
+            results = [task.result() for task in tasks]
+
+        for video_path, frames in zip(video_paths, results):
+            current_event_id = str(uuid.uuid4())
+            if expose_images:
+                # Expose images with original size, keep SSIM score order
+                for (frame_number, frame, _) in frames:
+                    await self._expose_frame(f"{frame_number:05d}", frame, frame.size[0], uid=current_event_id[:8])
+
+            frames, context = await self._crop_to_motion(frames, motion_crop)
+            if context:
+                _, frame, ssim_score = context
+                await self._add_frame(frame, f"{os.path.splitext(os.path.basename(video_path))[0]} (full view)" if include_filename else "Video full view",
+                                      ssim_score, target_width)
+                frame.release()
+
+            # Add frames to client, sorted by frame number instead of SSIM score
+            for counter, (_, frame, ssim_score) in enumerate(sorted(frames, key=lambda x: x[0]), start=1):
+                await self._add_frame(frame, f"{os.path.splitext(os.path.basename(video_path))[0]} (frame {counter})" if include_filename else f"Video frame {counter}",
+                                      ssim_score, target_width)
+                frame.release()
+
+        await self._add_mosaic(target_width)
         return self.client
 
-    async def add_streams(self, image_entities, duration, max_frames, target_width, include_filename, expose_images):
+    async def add_streams(self, image_entities, duration, max_frames, target_width, include_filename, expose_images, frame_selection=DEFAULT_FRAME_SELECTION, capture_mode=DEFAULT_CAPTURE_MODE, sample_rate=DEFAULT_SAMPLE_RATE, motion_crop=DEFAULT_MOTION_CROP):
         if image_entities:
             await self.record(
                 image_entities=image_entities,
@@ -520,6 +1362,10 @@ class MediaProcessor:
                 target_width=target_width,
                 include_filename=include_filename,
                 expose_images=expose_images,
+                frame_selection=frame_selection,
+                capture_mode=capture_mode,
+                sample_rate=sample_rate,
+                motion_crop=motion_crop,
             )
         return self.client
 
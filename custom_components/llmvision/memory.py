@@ -7,15 +7,23 @@ from .const import (
     CONF_TITLE_PROMPT,
     DEFAULT_SYSTEM_PROMPT,
     DEFAULT_TITLE_PROMPT,
+    DATA_IMAGE_CACHE,
 )
-import base64
+from .workers import media_workers
+from .image_encoder import EncodedImage
 import io
+from functools import partial
 from PIL import Image
 import logging
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
 class Memory:
     def __init__(self, hass, strings=[], paths=[], system_prompt=None):
         self.hass = hass
@@ -27,6 +35,7 @@ class Memory:
             self.memory_strings = strings
             self.memory_paths = paths
             self.memory_images = []
+            self.images = []
 
         else:
             self._system_prompt = system_prompt if system_prompt else self.entry.data.get(
@@ -38,6 +47,8 @@ class Memory:
             self.memory_paths = self.entry.data.get(CONF_MEMORY_PATHS, paths)
             self.memory_images = self.entry.data.get(
                 CONG_MEMORY_IMAGES_ENCODED, [])
+            # Stored as base64 in the config entry, AWS gets the bytes decoded once
+            self.images = [EncodedImage.from_base64(image) for image in self.memory_images]
 
         _LOGGER.debug(self)
 
@@ -46,70 +57,70 @@ class Memory:
         memory_prompt = "The following images along with descriptions serve as reference. They are not to be mentioned in the response."
 
         if memory_type == "OpenAI":
-            if self.memory_images:
+            if self.images:
                 content.append(
                     {"type": "text", "text": memory_prompt})
-            for image in self.memory_images:
-                tag = self.memory_strings[self.memory_images.index(image)]
+            for image in self.images:
+                tag = self.memory_strings[self.images.index(image)]
 
                 content.append(
                     {"type": "text", "text": tag + ":"})
                 content.append({"type": "image_url", "image_url": {
-                    "url": f"data:image/jpeg;base64,{image}"}})
+                    "url": image.data_url}})
 
         elif memory_type == "OpenAI-legacy":
-            if self.memory_images:
+            if self.images:
                 content.append(
                     {"type": "text", "text": memory_prompt})
-            for image in self.memory_images:
-                tag = self.memory_strings[self.memory_images.index(image)]
+            for image in self.images:
+                tag = self.memory_strings[self.images.index(image)]
 
                 content.append(
                     {"type": "text", "text": tag + ":"})
                 content.append({"type": "image_url", "image_url": {
-                    "url": f"data:image/jpeg;base64,{image}"}})
+                    "url": image.data_url}})
 
         elif memory_type == "Ollama":
-            if self.memory_images:
+            if self.images:
                 content.append(
                     {"role": "user", "content": memory_prompt})
-            for image in self.memory_images:
-                tag = self.memory_strings[self.memory_images.index(image)]
+            for image in self.images:
+                tag = self.memory_strings[self.images.index(image)]
 
                 content.append({"role": "user",
-                                "content": tag + ":", "images": [image]})
+                                "content": tag + ":", "images": [image.base64]})
 
         elif memory_type == "Anthropic":
-            if self.memory_images:
+            if self.images:
                 content.append(
                     {"type": "text", "text": memory_prompt})
-            for image in self.memory_images:
-                tag = self.memory_strings[self.memory_images.index(image)]
+            for image in self.images:
+                tag = self.memory_strings[self.images.index(image)]
 
                 content.append(
                     {"type": "text", "text": tag + ":"})
                 content.append({"type": "image", "source": {
-                    "type": "base64", "media_type": "image/jpeg", "data": f"{image}"}})
+                    "type": "base64", "media_type": image.mime_type, "data": image.base64}})
         elif memory_type == "Google":
-            if self.memory_images:
+            if self.images:
                 content.append({"text": memory_prompt})
-            for image in self.memory_images:
-                tag = self.memory_strings[self.memory_images.index(image)]
+            for image in self.images:
+                tag = self.memory_strings[self.images.index(image)]
 
                 content.append({"text": tag + ":"})
                 content.append(
-                    {"inline_data": {"mime_type": "image/jpeg", "data": image}})
+                    {"inline_data": {"mime_type": image.mime_type, "data": image.base64}})
         elif memory_type == "AWS":
-            if self.memory_images:
+            if self.images:
                 content.append(
                     {"text": memory_prompt})
-            for image in self.memory_images:
-                tag = self.memory_strings[self.memory_images.index(image)]
+            for image in self.images:
+                tag = self.memory_strings[self.images.index(image)]
 
                 content.append(
                     {"text": tag + ":"})
                 content.append({"image": {
-                    "format": "jpeg", "source": {"bytes": base64.b64decode(image)}}})
+                    "format": image.format, "source": {"bytes": image.data}}})
         else:
             return None
 
@@ -133,35 +144,45 @@ class Memory:
 
         return memory_entry
 
+    @staticmethod
+    def _encode_image(image_data):
+        """Resize an image to 512 pixels on its long side and encode it as JPEG"""
+        with Image.open(io.BytesIO(image_data)) as img:
+            img.load()
+            # calculate new height and width based on aspect ratio
+            width, height = img.size
+            aspect_ratio = width / height
+            if aspect_ratio > 1:
+                new_width = 512
+                new_height = int(512 / aspect_ratio)
+            else:
+                new_height = 512
+                new_width = int(512 * aspect_ratio)
+            img = img.resize((new_width, new_height))
+
+            # Convert Memory Images to RGB mode if needed
+            if img.mode == "RGBA":
+                img = img.convert("RGB")
+
+            img_byte_arr = io.BytesIO()
+            img.save(img_byte_arr, format='JPEG')
+            return img_byte_arr.getvalue()
+
     async def _encode_images(self, image_paths):
-        """Encode images as base64"""
+        """Encode images as EncodedImage, reusing cached encodings of unchanged images"""
         encoded_images = []
+        cache = self.hass.data.get(DATA_IMAGE_CACHE)
+        workers = media_workers(self.hass)
 
         for image_path in image_paths:
-            img = await self.hass.loop.run_in_executor(None, Image.open, image_path)
-            with img:
-                await self.hass.loop.run_in_executor(None, img.load)
-                # calculate new height and width based on aspect ratio
-                width, height = img.size
-                aspect_ratio = width / height
-                if aspect_ratio > 1:
-                    new_width = 512
-                    new_height = int(512 / aspect_ratio)
-                else:
-                    new_height = 512
-                    new_width = int(512 * aspect_ratio)
-                img = img.resize((new_width, new_height))
-
-                # Convert Memory Images to RGB mode if needed
-                if img.mode == "RGBA":
-                    img = img.convert("RGB")
-
-                # Encode the image to base64
-                img_byte_arr = io.BytesIO()
-                img.save(img_byte_arr, format='JPEG')
-                base64_image = base64.b64encode(
-                    img_byte_arr.getvalue()).decode('utf-8')
-                encoded_images.append(base64_image)
+            image_data = await self.hass.loop.run_in_executor(None, _read_file, image_path)
+            if cache is None:
+                data = await workers.run(self._encode_image, image_data)
+            else:
+                key = cache.key(image_data, "memory", 512)
+                data = await workers.run(
+                    cache.get_or_encode, key, partial(self._encode_image, image_data))
+            encoded_images.append(EncodedImage(data))
 
         return encoded_images
 
@@ -169,7 +190,8 @@ class Memory:
         """Manage encoded images"""
         # check if len(memory_paths) != len(memory_images)
         if len(self.memory_paths) != len(self.memory_images):
-            self.memory_images = await self._encode_images(self.memory_paths)
+            self.images = await self._encode_images(self.memory_paths)
+            self.memory_images = [image.base64 for image in self.images]
 
             # update memory with new images
             memory = self.entry.data.copy()
@@ -0,0 +1,95 @@
+# mosaic.py
+"""
+Grid images for providers that accept a single image per request.
+
+Instead of dropping all frames but one, the selected frames of every camera and
+video are tiled into one image with each tile labeled in its corner. The grid
+layout is chosen so the tiles are as large as possible within the provider's size
+limits (see sizing.py).
+"""
+import math
+import logging
+from PIL import Image, ImageDraw, ImageFont
+
+from .providers import Request
+from .const import (
+    DOMAIN,
+    CONF_MOONDREAM_IMAGE_SELECTION,
+    MOONDREAM_IMAGE_SELECTION_MOSAIC,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# Pixels between tiles
+TILE_GAP = 4
+# Label text height as a share of the tile height, and its minimum in pixels
+LABEL_SIZE = 0.06
+MIN_LABEL_SIZE = 12
+
+
+class Mosaic:
+    """Tiles labeled frames into one grid image"""
+
+    @classmethod
+    def from_call(cls, hass, call):
+        """Mosaic for providers that only accept one image, None for the others"""
+        entry_data = hass.data.get(DOMAIN, {}).get(call.provider) or {}
+        provider = Request.get_provider(hass, call.provider) if entry_data else None
+        if provider == "Groq":
+            return cls()
+        if provider == "Moondream" and entry_data.get(CONF_MOONDREAM_IMAGE_SELECTION) == MOONDREAM_IMAGE_SELECTION_MOSAIC:
+            return cls()
+        return None
+
+    @staticmethod
+    def layout(count, cell_size, sizing, max_width):
+        """(columns, rows, width) of the grid with the largest tiles the provider keeps"""
+        cell_width, cell_height = cell_size
+        best = None
+        for columns in range(1, count + 1):
+            rows = math.ceil(count / columns)
+            if columns > 1 and (columns - 1) * rows >= count:
+                # Same rows with a column fewer, can't have larger tiles
+                continue
+            grid_size = (columns * cell_width, rows * cell_height)
+            width = sizing.target_width(grid_size, max_width)
+            if best is None or width / columns > best[2] / best[0]:
+                best = (columns, rows, width)
+        return best
+
+    def compose(self, tiles, sizing, max_width):
+        """
+        Grid image of (label, image) tiles in row-major order.
+
+        Tiles are cells of the size of the largest image, smaller images and images
+        of other aspect ratios are fitted into their cell and centered.
+        """
+        cell_size = max((img.size for _, img in tiles), key=lambda size: size[0] * size[1])
+        columns, rows, width = self.layout(len(tiles), cell_size, sizing, max_width)
+        tile_width = max(1, (width - TILE_GAP * (columns - 1)) // columns)
+        tile_height = max(1, round(tile_width * cell_size[1] / cell_size[0]))
+        canvas = Image.new("RGB", (tile_width * columns + TILE_GAP * (columns - 1),
+                                   tile_height * rows + TILE_GAP * (rows - 1)))
+        draw = ImageDraw.Draw(canvas)
+        font = ImageFont.load_default(size=max(MIN_LABEL_SIZE, round(tile_height * LABEL_SIZE)))
+
+        for index, (label, img) in enumerate(tiles):
+            row, column = divmod(index, columns)
+            left = column * (tile_width + TILE_GAP)
+            top = row * (tile_height + TILE_GAP)
+            scale = min(tile_width / img.width, tile_height / img.height)
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            canvas.paste(img.resize(size, reducing_gap=2.0),
+                         (left + (tile_width - size[0]) // 2, top + (tile_height - size[1]) // 2))
+
+            # White label on a black box, readable on any background
+            text = label or str(index + 1)
+            padding = max(2, font.size // 4)
+            box = draw.textbbox((left + padding, top + padding), text, font=font)
+            draw.rectangle((box[0] - padding, box[1] - padding, box[2] + padding, box[3] + padding), fill="black")
+            draw.text((left + padding, top + padding), text, fill="white", font=font)
+
+        _LOGGER.debug(f"Composed {len(tiles)} frames into a {columns}x{rows} grid of {canvas.size}")
+        return canvas
@@ -8,7 +8,7 @@ import logging
 import inspect
 import re
 import json
-import base64
+from .sizing import openai_detail
 from .const import (
     DOMAIN,
     CONF_API_KEY,
@@ -60,7 +60,7 @@ class Request:
         self.message = message
         self.max_tokens = max_tokens
         self.temperature = temperature
-        self.base64_images = []
+        self.images = []  # EncodedImage of each frame
         self.filenames = []
         self.ssim_scores = []  # Add SSIM scores for better image selection
 
@@ -166,17 +166,17 @@ class Request:
         _LOGGER.info(f"Using model: {call.model}")
 
         # Check image input
-        if not call.base64_images:
+        if not call.images:
             raise ServiceValidationError(ERROR_NO_IMAGE_INPUT)
         
         provider = self.get_provider(self.hass, call.provider)
         
         # Check if single image is provided for Groq
-        if len(call.base64_images) > 1 and provider == 'Groq':
+        if len(call.images) > 1 and provider == 'Groq':
             raise ServiceValidationError(ERROR_GROQ_MULTIPLE_IMAGES)
             
         # Check if multiple images provided for Moondream
-        if len(call.base64_images) > 1 and provider == 'Moondream':
+        if len(call.images) > 1 and provider == 'Moondream':
             # Don't raise error, just log that we'll select one image
             _LOGGER.info(f"Moondream only supports one image per call. Will select image based on configuration.")
         
@@ -204,11 +204,13 @@ class Request:
         _LOGGER.debug(f"Detected provider: {provider} for entry_id: {entry_id}")
         _LOGGER.debug(f"Config data: {config}")
         
-        call.base64_images = self.base64_images
+        call.images = self.images
         call.filenames = self.filenames
         call.ssim_scores = self.ssim_scores  # Pass SSIM scores to call
 
         self.validate(call)
+        # OpenAI's resolution mode matching how the images were sized
+        call.openai_detail = openai_detail(provider, call.image_detail)
 
         if provider == 'OpenAI':
             api_key = config.get(CONF_API_KEY)
@@ -318,8 +320,9 @@ class Request:
         else:
             return {"response_text": response_text}
 
-    def add_frame(self, base64_image, filename, ssim_score=0.0):
-        self.base64_images.append(base64_image)
+    def add_frame(self, image, filename, ssim_score=0.0):
+        """Add an EncodedImage, providers convert it to the form they send"""
+        self.images.append(image)
         self.filenames.append(filename)
         self.ssim_scores.append(ssim_score)
 
@@ -457,26 +460,31 @@ class Moondream(Provider):
             'X-Moondream-Auth': self.api_key  # Moondream uses X-Moondream-Auth instead of Authorization Bearer
         }
 
-    def _select_image(self, call):
-        """Select which image to send based on configuration"""
-        if len(call.base64_images) == 1:
-            return call.base64_images[0], call.filenames[0] if call.filenames else ""
-        
+    def _select_index(self, call):
+        """Index of the image to send based on configuration"""
+        if len(call.images) == 1:
+            return 0
+
         if self.image_selection == MOONDREAM_IMAGE_SELECTION_FIRST:
-            return call.base64_images[0], call.filenames[0] if call.filenames else ""
+            return 0
         elif self.image_selection == MOONDREAM_IMAGE_SELECTION_LAST:
-            return call.base64_images[-1], call.filenames[-1] if call.filenames else ""
+            return len(call.images) - 1
         elif self.image_selection == MOONDREAM_IMAGE_SELECTION_BEST:
             # For "best" image, find the one with lowest SSIM score (most different/interesting)
             if hasattr(call, 'ssim_scores') and call.ssim_scores:
-                best_index = call.ssim_scores.index(min(call.ssim_scores))
-                return call.base64_images[best_index], call.filenames[best_index] if call.filenames else ""
+                return call.ssim_scores.index(min(call.ssim_scores))
             else:
                 # Fallback to first image if no SSIM scores available
                 _LOGGER.warning("SSIM scores not available for best image selection, using first image")
-                return call.base64_images[0], call.filenames[0] if call.filenames else ""
+                return 0
         else:
-            return call.base64_images[0], call.filenames[0] if call.filenames else ""
+            return 0
+
+    def _select_image(self, call):
+        """Select which image to send, returns (image, filename)"""
+        index = self._select_index(call)
+        filename = call.filenames[index] if call.filenames else ""
+        return call.images[index], filename
 
     async def _make_request(self, data) -> str:
         headers = self._generate_headers()
@@ -489,10 +497,8 @@ class Moondream(Provider):
         selected_image, selected_filename = self._select_image(call)
         
         # Moondream expects the image as a data URI
-        image_url = f"data:image/jpeg;base64,{selected_image}"
-        
         payload = {
-            "image_url": image_url,
+            "image_url": selected_image.data_url,
             "question": call.message,
             "stream": False
         }
@@ -508,9 +514,9 @@ class Moondream(Provider):
     def _prepare_text_data(self, call) -> dict:
         # For text-only requests (like title generation), we still need an image
         # Use the first available image or a placeholder
-        if call.base64_images:
+        if call.images:
             selected_image, _ = self._select_image(call)
-            image_url = f"data:image/jpeg;base64,{selected_image}"
+            image_url = selected_image.data_url
         else:
             # This shouldn't happen for Moondream, but just in case
             raise ServiceValidationError("Moondream requires an image for all requests")
@@ -569,13 +575,15 @@ class OpenAI(Provider):
                    "temperature": call.temperature
                    }
 
-        for image, filename in zip(call.base64_images, call.filenames):
-            tag = ("Image " + str(call.base64_images.index(image) + 1)
+        for image, filename in zip(call.images, call.filenames):
+            tag = ("Image " + str(call.images.index(image) + 1)
                    ) if filename == "" else filename
             payload["messages"][0]["content"].append(
                 {"type": "text", "text": tag + ":"})
-            payload["messages"][0]["content"].append({"type": "image_url", "image_url": {
-                "url": f"data:image/jpeg;base64,{image}"}})
+            image_url = {"url": image.data_url}
+            if call.openai_detail:
+                image_url["detail"] = call.openai_detail
+            payload["messages"][0]["content"].append({"type": "image_url", "image_url": image_url})
 
         payload["messages"][0]["content"].append(
             {"type": "text", "text": call.message})
@@ -642,13 +650,15 @@ class AzureOpenAI(Provider):
                    "temperature": call.temperature,
                    "stream": False
                    }
-        for image, filename in zip(call.base64_images, call.filenames):
-            tag = ("Image " + str(call.base64_images.index(image) + 1)
+        for image, filename in zip(call.images, call.filenames):
+            tag = ("Image " + str(call.images.index(image) + 1)
                    ) if filename == "" else filename
             payload["messages"][0]["content"].append(
                 {"type": "text", "text": tag + ":"})
-            payload["messages"][0]["content"].append({"type": "image_url", "image_url": {
-                "url": f"data:image/jpeg;base64,{image}"}})
+            image_url = {"url": image.data_url}
+            if call.openai_detail:
+                image_url["detail"] = call.openai_detail
+            payload["messages"][0]["content"].append({"type": "image_url", "image_url": image_url})
         payload["messages"][0]["content"].append(
             {"type": "text", "text": call.message})
 
@@ -713,13 +723,13 @@ class Anthropic(Provider):
             "max_tokens": call.max_tokens,
             "temperature": call.temperature
         }
-        for image, filename in zip(call.base64_images, call.filenames):
-            tag = ("Image " + str(call.base64_images.index(image) + 1)
+        for image, filename in zip(call.images, call.filenames):
+            tag = ("Image " + str(call.images.index(image) + 1)
                    ) if filename == "" else filename
             payload["messages"][0]["content"].append(
                 {"type": "text", "text": tag + ":"})
             payload["messages"][0]["content"].append({"type": "image", "source": {
-                "type": "base64", "media_type": "image/jpeg", "data": f"{image}"}})
+                "type": "base64", "media_type": image.mime_type, "data": image.base64}})
         payload["messages"][0]["content"].append(
             {"type": "text", "text": call.message})
 
@@ -785,12 +795,12 @@ class Google(Provider):
     def _prepare_vision_data(self, call) -> dict:
         payload = {"contents": [{"role": "user", "parts": []}], "generationConfig": {
             "maxOutputTokens": call.max_tokens, "temperature": call.temperature}}
-        for image, filename in zip(call.base64_images, call.filenames):
-            tag = ("Image " + str(call.base64_images.index(image) + 1)
+        for image, filename in zip(call.images, call.filenames):
+            tag = ("Image " + str(call.images.index(image) + 1)
                    ) if filename == "" else filename
             payload["contents"][0]["parts"].append({"text": tag + ":"})
             payload["contents"][0]["parts"].append(
-                {"inline_data": {"mime_type": "image/jpeg", "data": image}})
+                {"inline_data": {"mime_type": image.mime_type, "data": image.base64}})
         payload["contents"][0]["parts"].append({"text": call.message})
 
         if call.use_memory:
@@ -839,7 +849,7 @@ class Groq(Provider):
         return response_text
 
     def _prepare_vision_data(self, call) -> dict:
-        first_image = call.base64_images[0]
+        first_image = call.images[0]
         payload = {
             "messages": [
                 {
@@ -847,7 +857,7 @@ class Groq(Provider):
                     "content": [
                         {"type": "text", "text": call.message},
                         {"type": "image_url", "image_url": {
-                            "url": f"data:image/jpeg;base64,{first_image}"}}
+                            "url": first_image.data_url}}
                     ]
                 }
             ],
@@ -907,13 +917,13 @@ class LocalAI(Provider):
     def _prepare_vision_data(self, call) -> dict:
         payload = {"model": self.model, "messages": [{"role": "user", "content": [
         ]}], "max_tokens": call.max_tokens, "temperature": call.temperature}
-        for image, filename in zip(call.base64_images, call.filenames):
-            tag = ("Image " + str(call.base64_images.index(image) + 1)
+        for image, filename in zip(call.images, call.filenames):
+            tag = ("Image " + str(call.images.index(image) + 1)
                    ) if filename == "" else filename
             payload["messages"][0]["content"].append(
                 {"type": "text", "text": tag + ":"})
             payload["messages"][0]["content"].append(
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}})
+                {"type": "image_url", "image_url": {"url": image.data_url}})
         payload["messages"][0]["content"].append(
             {"type": "text", "text": call.message})
 
@@ -986,11 +996,11 @@ class Ollama(Provider):
             if system_prompt:
                 payload["system"] = system_prompt
 
-        for image, filename in zip(call.base64_images, call.filenames):
-            tag = ("Image " + str(call.base64_images.index(image) + 1)
+        for image, filename in zip(call.images, call.filenames):
+            tag = ("Image " + str(call.images.index(image) + 1)
                    ) if filename == "" else filename
             image_message = {"role": "user",
-                             "content": tag + ":", "images": [image]}
+                             "content": tag + ":", "images": [image.base64]}
             payload["messages"].append(image_message)
         prompt_message = {"role": "user", "content": call.message}
         payload["messages"].append(prompt_message)
@@ -1103,15 +1113,15 @@ class AWSBedrock(Provider):
         }
 
         # Bedrock converse API wants the raw bytes of the image
-        for image, filename in zip(call.base64_images, call.filenames):
-            tag = ("Image " + str(call.base64_images.index(image) + 1)
+        for image, filename in zip(call.images, call.filenames):
+            tag = ("Image " + str(call.images.index(image) + 1)
                    ) if filename == "" else filename
             payload["messages"][0]["content"].append(
                 {"text": tag + ":"})
             payload["messages"][0]["content"].append({
                 "image": {
-                    "format": "jpeg",
-                    "source": {"bytes": base64.b64decode(image)}
+                    "format": image.format,
+                    "source": {"bytes": image.data}
                 }
             })
         payload["messages"][0]["content"].append({"text": call.message})
@@ -0,0 +1,81 @@
+# sampling.py
+"""
+Frame sampling for videos.
+
+Keyframes are cheap to decode but their number depends on the camera's GOP
+length. The other modes pick timestamps from the video's duration, so the work
+grows with the number of samples instead of the length of the clip.
+"""
+import math
+import re
+
+from homeassistant.exceptions import ServiceValidationError
+
+from .const import (
+    FRAME_SAMPLING_COUNT,
+    FRAME_SAMPLING_FPS,
+    FRAME_SAMPLING_TIMESTAMPS,
+    DEFAULT_FRAME_SAMPLING,
+    DEFAULT_SAMPLE_COUNT,
+    DEFAULT_SAMPLE_RATE,
+)
+
+# Samples at least this many seconds apart are seeked to, denser ones are decoded in one pass
+SEEK_MIN_INTERVAL = 2
+
+
+def parse_timestamps(value):
+    """Seconds from a string of numbers separated by commas, spaces or newlines"""
+    if not value:
+        return []
+    if isinstance(value, (int, float)):
+        return [float(value)]
+    try:
+        return sorted(float(timestamp) for timestamp in re.split(r"[,\s]+", str(value).strip()) if timestamp)
+    except ValueError:
+        raise ServiceValidationError(
+            f"Timestamps {value} could not be parsed, expected seconds like '1.5, 4, 10'")
+
+
+class FrameSampling:
+    """Which frames of a video are decoded and scored"""
+
+    def __init__(self, mode=DEFAULT_FRAME_SAMPLING, count=DEFAULT_SAMPLE_COUNT, rate=DEFAULT_SAMPLE_RATE, timestamps=None):
+        self.mode = mode
+        self.count = max(1, int(count))
+        self.rate = float(rate)
+        self.sample_timestamps = [t for t in timestamps or [] if t >= 0]
+        if self.mode == FRAME_SAMPLING_FPS and self.rate <= 0:
+            raise ServiceValidationError("Sample rate must be greater than 0")
+        if self.mode == FRAME_SAMPLING_TIMESTAMPS and not self.sample_timestamps:
+            raise ServiceValidationError("No timestamps to sample given")
+
+    @classmethod
+    def from_call(cls, call):
+        """Sampling options of a service call"""
+        return cls(call.frame_sampling, call.sample_count, call.sample_rate,
+                   parse_timestamps(call.sample_timestamps))
+
+    @property
+    def keyframes(self):
+        return self.mode not in (FRAME_SAMPLING_COUNT, FRAME_SAMPLING_FPS, FRAME_SAMPLING_TIMESTAMPS)
+
+    def timestamps(self, duration):
+        """Seconds to sample in a video of the given duration, None if that needs the unknown duration"""
+        if self.mode == FRAME_SAMPLING_TIMESTAMPS:
+            return [t for t in self.sample_timestamps if duration is None or t < duration]
+        if not duration:
+            return None
+        # Samples sit in the middle of their interval, away from the first and last frame
+        if self.mode == FRAME_SAMPLING_COUNT:
+            step = duration / self.count
+            return [(i + 0.5) * step for i in range(self.count)]
+        step = 1 / self.rate
+        return [(i + 0.5) * step for i in range(max(1, math.floor(duration / step)))]
+
+    def pass_rate(self, duration):
+        """Frames per second to decode in a single pass, None when samples are seeked to instead"""
+        if self.mode == FRAME_SAMPLING_TIMESTAMPS or not duration:
+            return None
+        rate = self.count / duration if self.mode == FRAME_SAMPLING_COUNT else self.rate
+        return rate if 1 / rate < SEEK_MIN_INTERVAL else None
@@ -0,0 +1,145 @@
+# sizing.py
+"""
+Provider-aware output sizes.
+
+Providers bill and downscale images differently. Sending more pixels than a
+provider keeps only costs upload time, and for tiled billing a few pixels over a
+tile boundary cost a whole extra tile. The policy picks the largest size that is
+still useful to the provider for the requested detail level.
+"""
+import math
+
+from .const import (
+    DOMAIN,
+    CONF_DEFAULT_MODEL,
+    IMAGE_DETAIL_LOW,
+    IMAGE_DETAIL_MEDIUM,
+    IMAGE_DETAIL_HIGH,
+    DEFAULT_IMAGE_DETAIL,
+)
+
+# Dimensions are snapped down to a tile boundary when that loses at most this share of resolution
+TILE_SNAP = 0.1
+
+
+class SizeLimits:
+    """Limits for one provider and detail level, any of them may be None"""
+
+    def __init__(self, max_long=None, max_short=None, max_pixels=None, tile=None):
+        self.max_long = max_long
+        self.max_short = max_short
+        self.max_pixels = max_pixels
+        self.tile = tile
+
+    def scale(self, width, height, scale=1.0):
+        """Largest scale factor (at most scale) of a width x height image within the limits"""
+        if self.max_long:
+            scale = min(scale, self.max_long / max(width, height))
+        if self.max_short:
+            scale = min(scale, self.max_short / min(width, height))
+        if self.max_pixels:
+            scale = min(scale, math.sqrt(self.max_pixels / (width * height)))
+        if self.tile:
+            scale = self._snap(width, height, scale)
+        return scale
+
+    def _snap(self, width, height, scale):
+        """Shrink slightly so neither side starts a tile that would be mostly empty"""
+        snapped = scale
+        for side in (width * scale, height * scale):
+            tiles = math.ceil(side / self.tile)
+            if tiles > 1 and (tiles - 1) * self.tile >= side * (1 - TILE_SNAP):
+                snapped = min(snapped, scale * (tiles - 1) * self.tile / side)
+        return snapped
+
+
+# OpenAI: 'high' fits 2048x2048, then the short side is scaled to 768 and billed per 512 px tile.
+# 'low' is a single 512x512 image.
+# https://platform.openai.com/docs/guides/vision
+OPENAI_LIMITS = {
+    IMAGE_DETAIL_HIGH: SizeLimits(max_long=2048, max_short=768, tile=512),
+    IMAGE_DETAIL_MEDIUM: SizeLimits(max_long=2048, max_short=512, tile=512),
+    IMAGE_DETAIL_LOW: SizeLimits(max_long=512),
+}
+
+# Anthropic: images over 1568 px or ~1.15 megapixels are downscaled, tokens are about pixels / 750
+# https://docs.anthropic.com/en/docs/build-with-claude/vision
+ANTHROPIC_LIMITS = {
+    IMAGE_DETAIL_HIGH: SizeLimits(max_long=1568, max_pixels=1_150_000),
+    IMAGE_DETAIL_MEDIUM: SizeLimits(max_long=1568, max_pixels=590_000),
+    IMAGE_DETAIL_LOW: SizeLimits(max_long=1568, max_pixels=200_000),
+}
+
+# Gemini: images up to 384x384 cost 258 tokens, larger ones are cut into 768x768 tiles of 258 tokens each
+# https://ai.google.dev/gemini-api/docs/vision
+GOOGLE_LIMITS = {
+    IMAGE_DETAIL_HIGH: SizeLimits(max_long=1536, tile=768),
+    IMAGE_DETAIL_MEDIUM: SizeLimits(max_long=768),
+    IMAGE_DETAIL_LOW: SizeLimits(max_long=384),
+}
+
+# Llama 3.2 Vision on Groq: up to 4 tiles of 560x560
+GROQ_LIMITS = {
+    IMAGE_DETAIL_HIGH: SizeLimits(max_long=1120, tile=560),
+    IMAGE_DETAIL_MEDIUM: SizeLimits(max_long=1120, max_short=560, tile=560),
+    IMAGE_DETAIL_LOW: SizeLimits(max_long=560),
+}
+
+# Bedrock rejects images over 8000 px, Nova publishes no tiling so sizes are capped like a display
+BEDROCK_LIMITS = {
+    IMAGE_DETAIL_HIGH: SizeLimits(max_long=1920),
+    IMAGE_DETAIL_MEDIUM: SizeLimits(max_long=1280),
+    IMAGE_DETAIL_LOW: SizeLimits(max_long=640),
+}
+
+# Self-hosted and other providers, sized by target_width only at 'high'
+GENERIC_LIMITS = {
+    IMAGE_DETAIL_HIGH: SizeLimits(),
+    IMAGE_DETAIL_MEDIUM: SizeLimits(max_long=1024),
+    IMAGE_DETAIL_LOW: SizeLimits(max_long=512),
+}
+
+PROVIDER_LIMITS = {
+    "OpenAI": OPENAI_LIMITS,
+    "Azure": OPENAI_LIMITS,
+    "Anthropic": ANTHROPIC_LIMITS,
+    "Google": GOOGLE_LIMITS,
+    "Groq": GROQ_LIMITS,
+    "AWS Bedrock": BEDROCK_LIMITS,
+}
+
+
+def openai_detail(provider, image_detail):
+    """Value of OpenAI's 'detail' image parameter matching the sizing, None for other providers"""
+    if provider not in ("OpenAI", "Azure"):
+        return None
+    return "low" if image_detail == IMAGE_DETAIL_LOW else "high"
+
+
+class SizingPolicy:
+    """Output width of each image for a provider, model and detail level"""
+
+    def __init__(self, provider=None, model=None, image_detail=DEFAULT_IMAGE_DETAIL):
+        if provider == "AWS Bedrock" and model and "anthropic" in model:
+            # Claude on Bedrock resizes like the Anthropic API
+            limits = ANTHROPIC_LIMITS
+        else:
+            limits = PROVIDER_LIMITS.get(provider, GENERIC_LIMITS)
+        self.limits = limits.get(image_detail, limits[DEFAULT_IMAGE_DETAIL])
+
+    @classmethod
+    def from_call(cls, hass, call):
+        """Policy for the provider, model and detail level of a service call"""
+        # Imported here, providers imports this module for openai_detail
+        from .providers import Request
+
+        entry_data = hass.data.get(DOMAIN, {}).get(call.provider) or {}
+        provider = Request.get_provider(hass, call.provider) if entry_data else None
+        model = call.model or entry_data.get(CONF_DEFAULT_MODEL)
+        return cls(provider, model, call.image_detail)
+
+    def target_width(self, size, max_width):
+        """Width to encode an image of the given (width, height) at, never above max_width"""
+        width, height = size
+        scale = self.limits.scale(width, height, min(1.0, int(max_width) / width))
+        return max(1, math.floor(width * scale))
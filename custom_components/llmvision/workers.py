@@ -0,0 +1,73 @@
+# workers.py
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .const import DOMAIN, DATA_MEDIA_WORKERS, DEFAULT_MEDIA_WORKERS
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MediaWorkers:
+    """
+    Bounded thread pool that runs all image CPU work (decoding, scoring, resizing, encoding).
+
+    Pillow and NumPy release the GIL in their heavy loops, so the workers run in
+    parallel while the event loop and Home Assistant's shared executor stay free.
+    Queue depth and waiting times show when the pool is the bottleneck.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MEDIA_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix=f"{DOMAIN}_media")
+        # Jobs submitted and not finished, including the running ones
+        self.pending = 0
+        self.max_pending = 0
+        self.completed = 0
+        # Total seconds jobs waited for a free worker
+        self.wait_time = 0.0
+
+    @property
+    def queued(self):
+        """Jobs waiting for a free worker"""
+        return max(0, self.pending - self.max_workers)
+
+    async def run(self, func, *args):
+        """Run func(*args) in the pool and return its result"""
+        loop = asyncio.get_running_loop()
+        submitted = time.monotonic()
+        started = None
+
+        def job():
+            nonlocal started
+            started = time.monotonic()
+            return func(*args)
+
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        if self.queued:
+            _LOGGER.debug(f"{self.queued} image jobs waiting for one of {self.max_workers} workers")
+        try:
+            return await loop.run_in_executor(self._executor, job)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            if started is not None:
+                self.wait_time += started - submitted
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __str__(self):
+        average_wait = self.wait_time / self.completed if self.completed else 0
+        return (f"MediaWorkers({self.max_workers} workers, {self.pending} pending, {self.queued} queued, "
+                f"max {self.max_pending} pending, {self.completed} completed, {average_wait * 1000:.1f} ms average wait)")
+
+
+def media_workers(hass):
+    """Worker pool shared by all calls, created with the default size if setup didn't"""
+    if DATA_MEDIA_WORKERS not in hass.data:
+        hass.data[DATA_MEDIA_WORKERS] = MediaWorkers()
+    return hass.data[DATA_MEDIA_WORKERS]
@@ -0,0 +1,63 @@
+"""Tests for frame scoring and selection"""
+import numpy as np
+from PIL import Image, ImageDraw
+
+from custom_components.llmvision.frame_analysis import DiverseFrames, FrameQuality, SSIMScorer, prepare_frame
+
+
+def select(scores, max_frames):
+    frames = DiverseFrames(max_frames)
+    for position, score in enumerate(scores):
+        frames.offer(score, position, None)
+    return [(label, score) for label, _, score in frames.frames()]
+
+
+def test_diverse_frames_with_all_scores_above_one():
+    # Quality penalties push every score past 1
+    selected = select([1.2, 1.15, 1.3, 1.25, 1.1, 1.22, 1.18], 3)
+    assert selected == [(1, 1.15), (4, 1.1), (6, 1.18)]
+
+
+def test_diverse_frames_with_equal_scores_above_one():
+    assert len(select([1.27] * 10, 3)) == 3
+
+
+def dark_frames(count, size=(320, 180)):
+    """Night frames clipped to black except for a dim object moving across"""
+    frames = []
+    for index in range(count):
+        img = Image.new('L', size, 2)
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((0, 0, size[0], size[1] // 4), fill=30)
+        left = 20 + index * 25
+        draw.rectangle((left, 80, left + 40, 140), fill=90)
+        frames.append(img)
+    return frames
+
+
+def test_badly_exposed_source_still_returns_frames():
+    scorer = SSIMScorer()
+    frames = DiverseFrames(3)
+    for index, img in enumerate(dark_frames(10)):
+        _, score = scorer.score(img)
+        if score is not None:
+            # Equally bad frames aren't penalized
+            assert score <= 1
+            frames.offer(score, index, img)
+    assert len(frames.frames()) == 3
+
+
+def test_frames_worse_than_the_source_are_penalized():
+    quality = FrameQuality()
+    good = Image.effect_noise((320, 180), 40)
+    clipped = Image.new('L', (320, 180), 255)
+    assert quality.measure(prepare_frame(good)) == 1.0
+    assert quality.measure(prepare_frame(clipped)) < 0.5
+
+
+def test_prepare_frame_of_palette_and_16_bit_images():
+    rgb = Image.effect_noise((1280, 720), 40).convert('RGB')
+    for img in (rgb.convert('P'), Image.new('I;16', (1280, 720), 300), rgb):
+        frame = prepare_frame(img)
+        assert frame.shape == (180, 320)
+        assert frame.dtype == np.uint8
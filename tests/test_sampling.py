@@ -0,0 +1,15 @@
+"""Tests for video frame sampling"""
+from custom_components.llmvision.sampling import FrameSampling
+
+
+def test_count_sampling_returns_count_samples():
+    # duration / (duration / count) rounds below count for these
+    for count, duration in ((49, 3.3), (49, 13.2), (100, 503.6)):
+        timestamps = FrameSampling("count", count).timestamps(duration)
+        assert len(timestamps) == count
+        assert all(0 < t < duration for t in timestamps)
+
+
+def test_count_sampling_spaces_samples_evenly():
+    timestamps = FrameSampling("count", 4).timestamps(8.0)
+    assert timestamps == [1.0, 3.0, 5.0, 7.0]